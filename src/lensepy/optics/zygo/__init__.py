@@ -2,9 +2,18 @@ from .dataset import *
 from .images_model import *
 from .masks_model import *
 from .phase import *
+from .phase_map import *
+from .phase_shifting import *
 from .zernike_coefficients import *
 from .aberrations_simulation import *
 from .psf import *
+from .psf_energy import *
+from .mtf import *
+from .surface_statistics import *
+from .pipeline import *
+from .streaming import *
+from .unwrapping import *
 from .utils import *
 
-__all__ = ['DataSet', 'ImagesSet', 'MasksSet', 'PhaseModel','Zernike','SimulatedPhase','PSFModel']
+__all__ = ['DataSet', 'ImagesSet', 'MasksSet', 'PhaseModel','PhaseMap','PhaseShiftingAlgorithm','Zernike','SimulatedPhase','PSFModel','ProcessingPipeline','ZygoPipeline','StreamingPhaseMeasurement',
+           'SkimageUnwrapper','LeastSquaresUnwrapper','QualityGuidedUnwrapper','TiledUnwrapper']
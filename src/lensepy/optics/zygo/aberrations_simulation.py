@@ -1,4 +1,5 @@
 from lensepy.optics.zygo import *
+from lensepy.optics.zygo.phase_map import PhaseMap
 import numpy as np
 from matplotlib import pyplot as plt
 
@@ -10,6 +11,7 @@ class SimulatedPhase:
         self.pixel_size = pixel_size
         self.wavelength = 632.8e-9 # HeNe
         self.simulated_surface = None
+        self.surface_map = None
         self.complex_pupil = None
         self.perfect_psf = None
         self.psf_real = None
@@ -42,9 +44,8 @@ class SimulatedPhase:
             return None, 0
 
         # Pupil complexe
-        self.complex_pupil = np.zeros_like(self.simulated_surface, dtype=complex)
-        self.complex_pupil[self.pupil] = np.exp(1j * self.simulated_surface[self.pupil])
-        self.complex_pupil = np.ma.masked_where(np.logical_not(self.pupil), self.complex_pupil)
+        self.complex_pupil = np.zeros(self.pupil.shape, dtype=complex)
+        self.complex_pupil[self.pupil] = np.exp(1j * self.surface_map.get_values())
 
         return self.complex_pupil, self.complex_pupil.shape[0]
 
@@ -67,14 +68,18 @@ class SimulatedPhase:
         W_rec = np.zeros_like(self.pupil, dtype=float)
         for a, Zj in zip(self.coefficients, Z):
             W_rec += a * Zj
-        W_rec[~self.pupil] = np.nan
-        self.simulated_surface = np.ma.masked_where(np.logical_not(self.pupil), W_rec)
+        self.surface_map = PhaseMap(W_rec, self.pupil)
+        self.simulated_surface = self.surface_map.to_masked_array()
         return self.simulated_surface, self.pupil
 
     def get_unwrapped_phase(self):
         surface, pupil = self.process_unwrapped_phase()
         return surface
 
+    def get_unwrapped_map(self) -> PhaseMap:
+        self.process_unwrapped_phase()
+        return self.surface_map
+
     '''
     def get_psf2(self, pad_factor=8, normalized=True):
         N = self.complex_pupil.shape[0]
@@ -27,6 +27,10 @@ from masks import *
 from drivers.nidaq_piezo import NIDaqPiezo
 from utils.dataset_utils import generate_images_grid
 
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from lensepy.optics.zygo.streaming import StreamingPhaseMeasurement
+
 number_of_images = 5
 
 class HWState(Enum):
@@ -59,6 +63,7 @@ class AcquisitionModel:
         self.images_counter = 0             # To count acquired images in a set during thread
 
         self.thread = None
+        self.streaming = False
         # Init hardware
         self.camera_connected = self.camera.find_first_camera()
         if self.camera_connected:
@@ -189,6 +194,49 @@ class AcquisitionModel:
         else:
             self.camera.stop_acquisition()
 
+    def start_streaming(self, measurement: "StreamingPhaseMeasurement",
+                        settling_time: float = 0.0) -> bool:
+        """
+        Start a continuous acquisition for live wavefront measurement. The piezo voltages
+        are applied in a loop, and each frame is sent to the streaming measurement.
+        :param measurement: StreamingPhaseMeasurement object, with one phase step per voltage.
+            The measurement is reset before the acquisition.
+        :param settling_time: Waiting time after each piezo movement, in seconds. Default 0.
+        :return: Return False if acquisition is not possible.
+        """
+        if self.is_possible() is False:
+            return False
+        number = measurement.algorithm.get_number_of_steps()
+        if len(self.voltages_list) != number:
+            raise ValueError(f'start_streaming: {len(self.voltages_list)} voltages for a phase '
+                             f'shifting algorithm of {number} steps.')
+        measurement.reset()
+        self.streaming = True
+        self.thread = threading.Thread(target=self.thread_streaming, args=(measurement, settling_time))
+        self.thread.start()
+        return True
+
+    def stop_streaming(self):
+        """Stop the continuous acquisition."""
+        self.streaming = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def thread_streaming(self, measurement: "StreamingPhaseMeasurement", settling_time: float):
+        """
+        Thread for continuous acquisition of data.
+        """
+        self.camera.start_acquisition()
+        counter = 0
+        while self.streaming:
+            step = counter % len(self.voltages_list)
+            self.piezo.write_dac(self.voltages_list[step])
+            if settling_time > 0:
+                time.sleep(settling_time)
+            measurement.add_frame(self.camera.get_image(), step)
+            counter += 1
+        self.camera.stop_acquisition()
+
     def set_exposure(self, exposure: int) -> bool:
         """
         Set the exposure time of the camera.
@@ -9,6 +9,9 @@ from PyQt6.QtWidgets import (
     QGridLayout, QHBoxLayout
 )
 from scipy.fftpack import fftshift, ifftshift, fft2, ifft2
+from lensepy.optics.zygo.hariharan_algorithm import mask_bounding_box
+from lensepy.optics.zygo.psf import matrix_fourier_transform, get_reference
+from lensepy.optics.zygo.mtf import pupil_mtf
 import matplotlib.pyplot as plt
 
 from PyQt6.QtCore import pyqtSignal, QObject
@@ -112,11 +115,40 @@ class FourierManager(QObject):
         PSF = PSF / PSF.sum()  # normalizing the PSF
         return PSF
 
+    def PSF_MFT(self, complx_pupil, output_size: int = 128, sampling: float = 0.1):
+        """
+        Process the PSF only on a small grid centred on the optical axis, with any sampling,
+        by matrix Fourier transform. Same normalization as PSF for the same sampling
+        (the energy of the whole PSF plane is 1).
+        :param complx_pupil: Complex pupil, in 2D.
+        :param output_size: Size of the output grid, in pixels. Default 128.
+        :param sampling: Size of an output pixel, in λ/D (D = 2 * rpupil). Default 0.1.
+        :return: PSF of output_size x output_size pixels.
+        """
+        diameter = 2 * self.rpupil
+        # Only the support of the pupil is transformed (offset = linear phase of the field)
+        top, bottom, left, right = mask_bounding_box(complx_pupil != 0)
+        field = matrix_fourier_transform(complx_pupil[top:bottom, left:right], output_size,
+                                         sampling, diameter)
+        PSF = field.real ** 2 + field.imag ** 2
+        # Energy of the whole PSF plane, by Parseval
+        total = (diameter / sampling) ** 2 * np.sum(np.abs(complx_pupil) ** 2)
+        return PSF / total
+
+    def PSF_diffraction_limited(self, size: tuple):
+        """
+        Return the PSF of the perfect pupil (mask only), from the shared reference cache.
+        :param size: Size of the images (height, width).
+        :return: Diffraction-limited PSF, read-only array.
+        """
+        diff_lim_image = self.mask(size)
+        return get_reference(diff_lim_image > 0, ('fourier_manager', 'sum'),
+                             lambda: self.PSF(diff_lim_image))
+
     def find_rf_from_image(self, image):
         '''compares the result of the PSF treatment on the diffraction limit with the PSF of the actual image'''
         size = image.shape
-        diff_lim_image = self.mask(size)
-        psf_diff_lim = self.PSF(diff_lim_image)
+        psf_diff_lim = self.PSF_diffraction_limited(size)
 
         psf_image = self.PSF(image)
         h, w = size
@@ -126,7 +158,7 @@ class FourierManager(QObject):
 
     def find_rf_from_coefs(self, coefficients, size):
         diff_lim_image = self.mask(size)
-        psf_diff_lim = self.PSF(diff_lim_image)
+        psf_diff_lim = self.PSF_diffraction_limited(size)
 
         A = self.phase(coefficients, size)
         image = self.complex_pupil(A, diff_lim_image)
@@ -150,6 +182,17 @@ class FourierManager(QObject):
         mtf = abs(otf)
         return np.fft.fftshift(mtf)
 
+    def MTF_curves(self, complx_pupil, field_angle: float = 90.0):
+        """
+        Process the sagittal, tangential and azimuthally averaged MTF of a pupil (or of a stack
+        of pupils) from its autocorrelation, without processing the PSF.
+        :param complx_pupil: Complex pupil in 2D, or stack of pupils (K, N, N).
+        :param field_angle: Direction of the field point, in degrees from the x axis. Default 90.
+        :return: Structured array (frequency, sagittal, tangential, average), frequencies in
+            units of the cutoff frequency (D = 2 * rpupil).
+        """
+        return pupil_mtf(complx_pupil, 2 * self.rpupil, field_angle)
+
     def MTF_from_PSF(self, psf):
         otf = fft2(ifftshift(psf))
         otf_max = abs(otf[0, 0])
@@ -58,6 +58,120 @@ def hariharan_algorithm(intensity: list[np.ndarray], mask: np.ndarray = None) ->
         return np.arctan2(num, denum)
 
 
+def mask_bounding_box(mask: np.ndarray) -> tuple[int, int, int, int]:
+    """
+    Return the bounding box of the valid pixels of a mask.
+    :param mask: Boolean mask in 2D.
+    :return: First row, last row + 1, first column, last column + 1. Empty box if no valid pixel.
+    """
+    rows = np.flatnonzero(np.any(mask, axis=1))
+    cols = np.flatnonzero(np.any(mask, axis=0))
+    if rows.size == 0:
+        return 0, 0, 0, 0
+    return rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+
+def hariharan_terms(intensity: np.ndarray, num_out: np.ndarray = None,
+                    denum_out: np.ndarray = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Process the numerator and the denominator of the Hariharan algorithm, in float32.
+
+    The phase is arctan2(num, denum) and the modulation amplitude is hypot(num, denum) / 4.
+
+    Parameters
+    ----------
+    intensity : np.ndarray
+        Stack of intensity measurements shifted by π/2, of shape (5, H, W) or (S, 5, H, W)
+        for S sets.
+    num_out : np.ndarray, optional
+        Float32 buffer of shape (H, W) or (S, H, W) for the numerator 2 * (I4 - I2).
+    denum_out : np.ndarray, optional
+        Float32 buffer of shape (H, W) or (S, H, W) for the denominator 2 * I3 - I5 - I1.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        The numerator and the denominator.
+    """
+    frames = [intensity[..., k, :, :] for k in range(5)]
+    num = np.subtract(frames[3], frames[1], out=num_out, dtype=np.float32)
+    num *= 2
+    denum = np.add(frames[2], frames[2], out=denum_out, dtype=np.float32)
+    denum -= frames[4]
+    denum -= frames[0]
+    return num, denum
+
+
+def hariharan_kernel(intensity: np.ndarray, mask: np.ndarray = None,
+                     phase_out: np.ndarray = None, amplitude_out: np.ndarray = None,
+                     work: np.ndarray = None, bbox: tuple[int, int, int, int] = None,
+                     outside: np.ndarray = None):
+    """
+    Apply the Hariharan phase demodulation algorithm to a stack of 5 raw frames, in float32.
+
+    Same phase as hariharan_algorithm, but frames are read directly in their own data type
+    (uint8, uint16 or float), only the bounding box of the mask is processed and the results
+    are written in caller-provided buffers, so that a continuous measurement does not allocate
+    any array when all the buffers and the pixels outside the mask are given.
+
+    Parameters
+    ----------
+    intensity : np.ndarray
+        Stack of shape (5, H, W) of intensity measurements, shifted by π/2.
+    mask : np.ndarray, optional
+        Boolean mask of shape (H, W). Pixels outside the mask are set to 0.
+    phase_out : np.ndarray, optional
+        Float32 buffer of shape (H, W) for the demodulated phase.
+    amplitude_out : np.ndarray, optional
+        Float32 buffer of shape (H, W) for the modulation amplitude B of I = A + B cos(phi + delta).
+        Not processed if None.
+    work : np.ndarray, optional
+        Float32 buffer of shape (H, W) used for intermediate results.
+    bbox : tuple, optional
+        Bounding box of the mask (see mask_bounding_box), if already known.
+    outside : np.ndarray, optional
+        Boolean array of shape (H, W), np.logical_not(mask), if already known.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        The demodulated phase and the modulation amplitude (None if amplitude_out is None).
+    """
+    _, height, width = intensity.shape
+    if phase_out is None:
+        phase_out = np.empty((height, width), dtype=np.float32)
+    if work is None:
+        work = np.empty((height, width), dtype=np.float32)
+    if bbox is None:
+        bbox = (0, height, 0, width) if mask is None else mask_bounding_box(mask)
+    r0, r1, c0, c1 = bbox
+    frames = intensity[:, r0:r1, c0:c1]
+    num, denum = hariharan_terms(frames, phase_out[r0:r1, c0:c1], work[r0:r1, c0:c1])
+
+    outputs = [phase_out]
+    if amplitude_out is not None:
+        amplitude = amplitude_out[r0:r1, c0:c1]
+        np.hypot(num, denum, out=amplitude)
+        amplitude *= 0.25
+        outputs.append(amplitude_out)
+    np.arctan2(num, denum, out=num)
+
+    # Pixels outside the mask
+    if mask is not None:
+        if outside is None:
+            outside = np.logical_not(mask[r0:r1, c0:c1])
+        else:
+            outside = outside[r0:r1, c0:c1]
+    for out in outputs:
+        out[:r0] = 0
+        out[r1:] = 0
+        out[r0:r1, :c0] = 0
+        out[r0:r1, c1:] = 0
+        if mask is not None:
+            np.copyto(out[r0:r1, c0:c1], 0, where=outside)
+    return phase_out, amplitude_out
+
+
 def display_3D_surface(Z: np.ndarray, mask: np.ndarray = None, size: int = 25, title: str = ''):
     """Display a 3D surface."""
     # Array for displaying data on 3D projection
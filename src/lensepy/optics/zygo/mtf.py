@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""*mtf.py* file.
+
+./models/mtf.py contains the processing of the MTF (Modulation Transfer Function) of a pupil,
+as the modulus of its autocorrelation (OTF).
+
+The autocorrelation is processed with one FFT of the pupil zero-padded to twice its size
+plus two pixels (the smallest grid without aliasing that includes the cutoff frequency)
+and one real FFT of the square modulus (the inverse
+transform of a real array, of which only one half-plane is required). The PSF is not
+processed. Curves are given in units of the cutoff frequency D / (λ f) : a frequency of 1
+corresponds to a shift of the whole pupil diameter.
+
+.. note:: LEnsE - Institut d'Optique - version 1.0
+
+.. moduleauthor:: Julien VILLEMEJANE (PRAG LEnsE) <julien.villemejane@institutoptique.fr>
+Creation : october/2026
+"""
+import numpy as np
+import scipy.fft
+from scipy.ndimage import map_coordinates
+from lensepy.optics.zygo.hariharan_algorithm import mask_bounding_box
+from lensepy.optics.zygo.psf_energy import radial_profile
+
+# Number of pupils processed together (memory of the FFT grids)
+MTF_BATCH_SIZE = 16
+
+mtf_curves_dtype = np.dtype([('frequency', float), ('sagittal', float), ('tangential', float),
+                             ('average', float)])
+
+
+def pupil_mtf(pupil: np.ndarray, diameter: float = None, field_angle: float = 90.0,
+              dtype=np.complex128, workers: int = -1) -> np.ndarray:
+    """
+    Process the MTF curves of a pupil from its autocorrelation.
+    :param pupil: Complex pupil in 2D (0 outside the pupil), or stack of pupils (K, N, N)
+        sharing the same support.
+    :param diameter: Diameter D of the pupil, in pixels. Default None, largest size of the
+        support of the pupil.
+    :param field_angle: Direction of the field point in the pupil plane, in degrees from the
+        x axis (columns). The tangential frequencies are along this direction, the sagittal
+        frequencies perpendicular to it. Default 90, field point along y (rows).
+    :param dtype: Complex data type of the FFT, np.complex64 to halve the memory.
+        Default np.complex128.
+    :param workers: Number of threads of the FFT. Default -1, all the processors.
+    :return: Structured array (frequency, sagittal, tangential, average) of the frequencies from
+        0 to 1 (cutoff frequency), or array (K, number of frequencies) for a stack.
+        Average is the azimuthal average of the 2D MTF.
+    """
+    pupil = np.asarray(pupil)
+    single = pupil.ndim == 2
+    stack = pupil[np.newaxis] if single else pupil
+    top, bottom, left, right = mask_bounding_box(np.any(stack != 0, axis=0))
+    stack = stack[:, top:bottom, left:right]
+    height, width = stack.shape[1:]
+    if diameter is None:
+        diameter = max(height, width)
+    # Shifts of the pupil (in pixels) of the frequencies from 0 to the cutoff (included)
+    number = int(np.ceil(diameter)) + 1
+    # Grid without aliasing, with the shifts up to the cutoff on both sides of the centre
+    grid = (scipy.fft.next_fast_len(max(2 * height, 2 * number)),
+            scipy.fft.next_fast_len(max(2 * width, 2 * number)))
+    shifts = np.arange(number)
+
+    # Coordinates of the sagittal and tangential frequencies in the half-plane (columns >= 0)
+    angle = np.deg2rad(field_angle)
+    coordinates = []
+    for direction in (angle + np.pi / 2, angle):
+        rows, columns = shifts * np.sin(direction), shifts * np.cos(direction)
+        if np.cos(direction) < -1e-12:
+            # MTF(-f) = MTF(f)
+            rows, columns = -rows, -columns
+        coordinates.append(np.stack([rows + grid[0] // 2, np.abs(columns)]))
+
+    curves = np.empty((stack.shape[0], number), dtype=mtf_curves_dtype)
+    curves['frequency'] = shifts / diameter
+    for start in range(0, stack.shape[0], MTF_BATCH_SIZE):
+        mtf = _half_plane_mtf(stack[start:start + MTF_BATCH_SIZE], grid, dtype, workers)
+        batch = slice(start, start + mtf.shape[0])
+        for name, coordinate in zip(('sagittal', 'tangential'), coordinates):
+            curves[name][batch] = [map_coordinates(m, coordinate, order=1) for m in mtf]
+        _, curves['average'][batch] = radial_profile(mtf, center=(grid[0] // 2, 0),
+                                                     radius_max=number - 1)
+    return curves[0] if single else curves
+
+
+def _half_plane_mtf(pupils: np.ndarray, grid: tuple, dtype, workers: int) -> np.ndarray:
+    """
+    Return the MTF of a stack of pupils on the half-plane of the positive frequencies along
+    the columns, shape (K, grid[0], grid[1] // 2 + 1), zero frequency at (grid[0] // 2, 0).
+    """
+    field = scipy.fft.fft2(pupils.astype(dtype, copy=False), s=grid, workers=workers)
+    power = field.real ** 2 + field.imag ** 2
+    del field
+    # Autocorrelation = inverse FFT of the power spectrum, conj(FFT) / n for a real array
+    otf = scipy.fft.rfft2(power, workers=workers)
+    mtf = np.abs(otf)
+    mtf /= mtf[:, :1, :1]
+    return np.fft.fftshift(mtf, axes=1)
+
+
+if __name__ == '__main__':
+    import time
+    y, x = np.indices((256, 256))
+    r = np.hypot(x - 127.5, y - 127.5) / 128
+    pupils = np.stack([(r <= 1) * np.exp(2j * np.pi * 0.05 * k * (2 * r ** 2 - 1)) for k in range(100)])
+    start = time.perf_counter()
+    curves = pupil_mtf(pupils)
+    print(f'MTF of {len(pupils)} pupils in {(time.perf_counter() - start) * 1e3:.0f} ms')
+    nu = curves['frequency'][0]
+    perfect = 2 / np.pi * (np.arccos(nu) - nu * np.sqrt(1 - nu ** 2))
+    print(f'Max error to the perfect MTF = {np.abs(curves["average"][0] - perfect).max():.4f}')
@@ -11,25 +11,135 @@ Phase is demodulated by the Hariharan phase demodulation algorithm from a set of
 Creation : march/2025
 """
 import cv2
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import scipy.fft
 from lensepy.images.conversion import crop_images, find_mask_limits
 from lensepy.optics.zygo.hariharan_algorithm import *
 from lensepy.optics.zygo.images_model import ImagesSet
 from lensepy.optics.zygo.masks_model import MasksSet
 from lensepy.optics.zygo.zernike_coefficients import Zernike
 from lensepy.optics.zygo.dataset import DataSetState
-from skimage.restoration import unwrap_phase
+from lensepy.optics.zygo.phase_map import PhaseMap
+from lensepy.optics.zygo.surface_statistics import process_statistics_surface
+from lensepy.optics.zygo.unwrapping import PhaseUnwrapper, SkimageUnwrapper, get_unwrapper
 from scipy.ndimage import gaussian_filter
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from .dataset import DataSet
 
-def process_statistics_surface(surface):
-    # Process (Peak-to-Valley) and RMS
-    PV = np.round(np.nanmax(surface) - np.nanmin(surface), 2)
-    RMS = np.round(np.nanstd(surface), 2)
-    return PV, RMS
+PREFILTER_SIGMA = 10
+# Above this standard deviation, the gaussian filter is processed by FFT
+PREFILTER_FFT_SIGMA = 4
+
+
+def gaussian_prefilter(images, sigma: float = PREFILTER_SIGMA,
+                       fft_sigma: float = PREFILTER_FFT_SIGMA, workers: int = -1) -> np.ndarray:
+    """
+    Gaussian blur of a stack of images, in float32, along the two last axes only.
+    Borders are reflected, as scipy.ndimage.gaussian_filter.
+    :param images: Stack of shape (N, H, W) or list of N arrays in 2D.
+    :param sigma: Standard deviation of the gaussian, in pixels. None or 0 to disable.
+    :param fft_sigma: Standard deviation above which the filter is processed by FFT.
+    :param workers: Number of threads of the FFT. Default -1, all the processors.
+    :return: Filtered stack of shape (N, H, W), in float32.
+    """
+    stack = np.stack([np.ma.getdata(image) for image in images]).astype(np.float32, copy=False)
+    if not sigma:
+        return stack
+    if sigma < fft_sigma:
+        return gaussian_filter(stack, sigma=(0, sigma, sigma))
+    # Gaussian transfer function on a grid padded by reflection
+    pad = int(np.ceil(4 * sigma))
+    height = scipy.fft.next_fast_len(stack.shape[1] + 2 * pad, real=True)
+    width = scipy.fft.next_fast_len(stack.shape[2] + 2 * pad, real=True)
+    padded = np.pad(stack, ((0, 0), (pad, height - stack.shape[1] - pad),
+                            (pad, width - stack.shape[2] - pad)), mode='symmetric')
+    fy = scipy.fft.fftfreq(height).astype(np.float32)
+    fx = scipy.fft.rfftfreq(width).astype(np.float32)
+    transfer = np.exp(-2 * (np.pi * sigma) ** 2 * (fy[:, np.newaxis] ** 2 + fx[np.newaxis, :] ** 2))
+    spectrum = scipy.fft.rfft2(padded, workers=workers)
+    spectrum *= transfer
+    filtered = scipy.fft.irfft2(spectrum, s=(height, width), workers=workers)
+    return filtered[:, pad:pad + stack.shape[1], pad:pad + stack.shape[2]]
+
+
+def crop_data_set(data_set: "DataSet", sigma: float = PREFILTER_SIGMA,
+                  workers: int = 1) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Crop all the sets of images of a data set to the limits of its global mask and apply
+    the gaussian pre-filter.
+    :param data_set: DataSet object containing images and masks.
+    :param sigma: Standard deviation of the gaussian, in pixels. None or 0 to disable.
+    :param workers: Number of threads to filter the sets of images. Default 1.
+    :return: Stack of the cropped sets (S, N, H, W) in float32 and cropped mask (H, W).
+    """
+    mask = data_set.get_global_mask()
+    top_left, bottom_right = find_mask_limits(mask)
+    height, width = bottom_right[1] - top_left[1], bottom_right[0] - top_left[0]
+    pos_x, pos_y = top_left[1], top_left[0]
+    mask_cropped = crop_images([mask], (height, width), (pos_x, pos_y))[0]
+
+    def prefilter(k, fft_workers=-1):
+        # Sets of images are numbered from 1
+        images = data_set.get_images_sets(k + 1)
+        images_c = crop_images(images, (height, width), (pos_x, pos_y))
+        return gaussian_prefilter(images_c, sigma, workers=fft_workers)
+
+    number_of_sets = data_set.images_sets.get_number_of_sets()
+    if workers > 1 and number_of_sets > 1:
+        # One FFT thread per set, not to oversubscribe the processors
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            stacks = list(executor.map(lambda k: prefilter(k, 1), range(number_of_sets)))
+    else:
+        stacks = [prefilter(k) for k in range(number_of_sets)]
+    return np.stack(stacks), np.asarray(mask_cropped, dtype=bool)
+
+
+def demodulate_sets(images: np.ndarray, mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Process the Hariharan terms of a stack of sets of 5 images, 0 outside the mask.
+    :param images: Stack of shape (S, 5, H, W).
+    :param mask: Boolean mask of shape (H, W).
+    :return: Numerator and denominator of each set, arrays (S, H, W) in float32.
+    """
+    num, denum = hariharan_terms(images)
+    # Pixels outside the mask are set to 0 (as hariharan_kernel)
+    not_mask = np.logical_not(mask)
+    num[:, not_mask] = 0
+    denum[:, not_mask] = 0
+    return num, denum
+
+
+def average_wrapped_phase(num: np.ndarray, denum: np.ndarray,
+                          mask: np.ndarray) -> tuple[PhaseMap, np.ndarray]:
+    """
+    Average the wrapped phase of several sets by summing their fringes before the arctangent
+    (complex average, each set is weighted by its modulation).
+    :param num: Numerators of the Hariharan algorithm, array (S, H, W).
+    :param denum: Denominators of the Hariharan algorithm, array (S, H, W).
+    :param mask: Boolean mask of shape (H, W).
+    :return: Averaged wrapped phase and modulation amplitude (H, W).
+    """
+    num_sum, denum_sum = num.sum(axis=0), denum.sum(axis=0)
+    wrapped_phase = PhaseMap(np.arctan2(num_sum, denum_sum), mask)
+    modulation = np.hypot(num_sum, denum_sum) / (4 * num.shape[0])
+    return wrapped_phase, modulation
+
+
+def unwrap_phase_map(wrapped_phase: PhaseMap, modulation: np.ndarray,
+                     unwrapper: PhaseUnwrapper) -> PhaseMap:
+    """
+    Unwrap a wrapped phase, with the modulation of the fringes as quality map.
+    :param wrapped_phase: Wrapped phase, in radians.
+    :param modulation: Modulation amplitude of the fringes, in 2D. None for no quality map.
+    :param unwrapper: PhaseUnwrapper object.
+    :return: Unwrapped phase, in waves.
+    """
+    unwrapped = unwrapper.unwrap(wrapped_phase.data, wrapped_phase.get_mask(), quality=modulation)
+    return PhaseMap(unwrapped / (2 * np.pi), like=wrapped_phase)
+
 
 class PhaseModel:
     """Class containing phase data and parameters.
@@ -45,37 +155,38 @@ class PhaseModel:
         self.cropped_masks_sets = MasksSet()
         self.cropped_data_ready = False
         self.wrapped_phase = None
+        self.modulation = None
         self.unwrapped_phase = None
+        self.unwrapper: PhaseUnwrapper = SkimageUnwrapper()
+        self.prefilter_sigma = PREFILTER_SIGMA
+        self.prefilter_workers = 1
         self.wedge_factor = 1.0
 
     def prepare_data(self):
         """
-        Crop the images.
-        :return:
+        Crop the images to the mask limits and apply the gaussian pre-filter (see set_prefilter).
         """
         self.cropped_masks_sets.reset_masks()
-        mask = self.data_set.get_global_mask()
-        top_left, bottom_right = find_mask_limits(mask)
-        height, width = bottom_right[1] - top_left[1], bottom_right[0] - top_left[0]
-        pos_x, pos_y = top_left[1], top_left[0]
-        mask_cropped = crop_images([mask], (height, width), (pos_x, pos_y))[0]
+        stacks, mask_cropped = crop_data_set(self.data_set, self.prefilter_sigma, self.prefilter_workers)
         self.cropped_masks_sets.add_mask(mask_cropped)
 
         # Process all the sets of images
         self.cropped_images_sets.reset_all_images()
-        for k in range(self.data_set.images_sets.get_number_of_sets()):
-            images = self.data_set.get_images_sets(k)
-            # Process all images in the set
-            images_c = crop_images(images, (height, width), (pos_x, pos_y))
-            images_f = list(map(lambda x: gaussian_filter(x, 10), images_c))
-            for im_k, image_f in enumerate(images_f):
-                image_f = image_f.astype(np.float32)
-                image_f[~mask_cropped] = np.nan
-                images_f[im_k] = np.ma.masked_where(np.logical_not(mask_cropped), image_f)
-            self.cropped_images_sets.add_set_images(images_f)
+        for stack in stacks:
+            self.cropped_images_sets.add_set_images(list(stack))
         self.cropped_data_ready = True
         self.data_set.set_cropped_state(True)
 
+    def set_prefilter(self, sigma: float = PREFILTER_SIGMA, workers: int = 1):
+        """
+        Set the gaussian pre-filter applied to the cropped images by prepare_data.
+        :param sigma: Standard deviation of the gaussian, in pixels. None or 0 to disable.
+            Default 10.
+        :param workers: Number of threads to filter the sets of images. Default 1.
+        """
+        self.prefilter_sigma = sigma
+        self.prefilter_workers = workers
+
     def process_wrapped_phase(self, set_number: int=1):
         """
         Process Hariharan demodulation altorithm on data (set of 5 images).
@@ -86,8 +197,10 @@ class PhaseModel:
             self.cropped_phase = []
             mask,_ = self.cropped_masks_sets.get_mask(1)
             images_list = self.cropped_images_sets.get_images_set(set_number)
-            self.wrapped_phase = hariharan_algorithm(images_list, mask)
-            self.wrapped_phase = np.ma.masked_where(np.logical_not(mask), self.wrapped_phase)
+            images = np.stack([np.ma.getdata(image) for image in images_list])
+            wrapped_phase, self.modulation = hariharan_kernel(
+                images, mask, amplitude_out=np.empty(mask.shape, dtype=np.float32))
+            self.wrapped_phase = PhaseMap(wrapped_phase, mask)
             self.data_set.set_wrapped_state(True)
             return True
         else:
@@ -95,25 +208,84 @@ class PhaseModel:
             return False
 
 
+    def process_wrapped_phase_all(self, complex_average: bool = True):
+        """
+        Process Hariharan demodulation algorithm on all the sets of images at once,
+        and average the phase of the sets.
+
+        The sets are stacked in a (S, 5, H, W) array and demodulated together.
+        With complex averaging, the fringes of all the sets are summed (weighted by their
+        modulation) before the arctangent, so that a single unwrapping is required by
+        process_unwrapped_phase. Otherwise, each set is unwrapped and the unwrapped phases
+        are averaged, after removing the 2π offsets between sets.
+
+        :param complex_average: True to average before unwrapping. Default True.
+        :return: Wrapped phase of each set (S, H, W) and averaged wrapped phase (H, W).
+            None, None if the data are not ready.
+        """
+        if not (self.data_set.is_data_ready() and self.cropped_data_ready):
+            self.wrapped_phase = None
+            return None, None
+        mask, _ = self.cropped_masks_sets.get_mask(1)
+        mask = np.asarray(mask, dtype=bool)
+        number_of_sets = self.cropped_images_sets.get_number_of_sets()
+        images = np.stack([np.stack([np.ma.getdata(image) for image in
+                                     self.cropped_images_sets.get_images_set(k + 1)])
+                           for k in range(number_of_sets)])
+        num, denum = demodulate_sets(images, mask)
+        phases = np.ma.masked_where(np.broadcast_to(~mask, num.shape), np.arctan2(num, denum))
+        self.wrapped_phase, self.modulation = average_wrapped_phase(num, denum, mask)
+        self.data_set.set_wrapped_state(True)
+
+        if not complex_average:
+            unwrapped = np.empty(num.shape)
+            for k in range(number_of_sets):
+                # Modulation of the set as quality map, as process_unwrapped_phase
+                quality = np.hypot(num[k], denum[k]) / 4
+                unwrapped[k] = self.unwrapper.unwrap(np.ma.getdata(phases[k]), mask, quality=quality)
+                if k > 0:
+                    offset = np.nanmean((unwrapped[k] - unwrapped[0])[mask])
+                    unwrapped[k] -= 2 * np.pi * np.round(offset / (2 * np.pi))
+            self.unwrapped_phase = PhaseMap(unwrapped.mean(axis=0) / (2 * np.pi), like=self.wrapped_phase)
+            self.data_set.set_unwrapped_state()
+        return phases, self.wrapped_phase.to_masked_array()
+
     def get_wrapped_phase(self) -> np.ndarray:
         """
-        Return the wrapped phase if calculated
-        :return: Wrapped phase as an array in 2D.
+        Return the wrapped phase if calculated, for display.
+        :return: Wrapped phase as a masked array in 2D.
         """
         if self.wrapped_phase is not None:
-            return self.wrapped_phase
+            return self.wrapped_phase.to_masked_array()
         return None
 
-    def process_unwrapped_phase(self):
+    def get_modulation(self) -> np.ndarray:
         """
-        Process unwrapping algorithm from Skimage-restauration.
-        :return: True if Hariharan algorithm is processed. None if not processed.
+        Return the modulation amplitude of the fringes, processed with the wrapped phase.
+        :return: Modulation amplitude as an array in 2D. None if not processed.
+        """
+        return self.modulation
+
+    def set_unwrapper(self, unwrapper, **kwargs):
+        """
+        Set the phase unwrapping algorithm.
+        :param unwrapper: Name of the algorithm ('skimage', 'least_squares', 'quality' or
+            'tiled' for a process pool on overlapping tiles) or PhaseUnwrapper object.
+        :param kwargs: Parameters of the unwrapper, if a name is given.
+        """
+        if isinstance(unwrapper, str):
+            unwrapper = get_unwrapper(unwrapper, **kwargs)
+        self.unwrapper = unwrapper
+
+    def process_unwrapped_phase(self, method: str = None):
+        """
+        Process unwrapping algorithm. The modulation of the fringes is used as quality map.
+        :param method: Name of the algorithm for this call only. Default None, current unwrapper.
+        :return: True if the unwrapped phase is processed.
         """
         if self.wrapped_phase is not None:
-            mask, _ = self.cropped_masks_sets.get_mask(1)
-            self.unwrapped_phase = unwrap_phase(self.wrapped_phase) / (2 * np.pi)
-            self.unwrapped_phase[~mask] = np.nan
-            self.unwrapped_phase = np.ma.masked_where(np.logical_not(mask), self.unwrapped_phase)
+            unwrapper = self.unwrapper if method is None else get_unwrapper(method)
+            self.unwrapped_phase = unwrap_phase_map(self.wrapped_phase, self.modulation, unwrapper)
             self.data_set.set_unwrapped_state()
             return True
         else:
@@ -122,14 +294,23 @@ class PhaseModel:
 
     def get_unwrapped_phase(self) -> np.ndarray:
         """
-        Return the unwrapped phase if calculated
-        :return: Unwrapped phase as an array in 2D. None if not processed.
+        Return the unwrapped phase if calculated, for display.
+        :return: Unwrapped phase as a masked array in 2D. None if not processed.
         """
         if self.unwrapped_phase is not None:
-            return -self.unwrapped_phase * self.wedge_factor
+            return self.get_unwrapped_map().to_masked_array()
         else:
             return None
 
+    def get_unwrapped_map(self) -> PhaseMap:
+        """
+        Return the unwrapped phase if calculated, scaled by the wedge factor.
+        :return: PhaseMap object. None if not processed.
+        """
+        if self.unwrapped_phase is not None:
+            return self.unwrapped_phase.scaled(-self.wedge_factor)
+        return None
+
     def is_analysis_ready(self):
         """
         Check if wrapped and unwrapped phase are processed from images.
@@ -143,6 +324,7 @@ class PhaseModel:
     def reset_phase(self):
         """Reset all the data of the phase object (wrapped and unwrapped)."""
         self.wrapped_phase = None
+        self.modulation = None
         self.unwrapped_phase = None
         self.data_set.set_cropped_state()
 
@@ -168,7 +350,7 @@ class PhaseModel:
 
     def get_surface(self):
         if self.unwrapped_phase is not None:
-            return self.unwrapped_phase, self.unwrapped_phase.shape[0]
+            return self.unwrapped_phase.to_masked_array(), self.unwrapped_phase.shape[0]
         else:
             return None, 0
 
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""*phase_map.py* file.
+
+./models/phase_map.py contains PhaseMap class, a compact container of a phase (or surface)
+defined on a pupil.
+
+Data are stored in a contiguous float32 array (0 outside the pupil, no NaN), with a
+bit-packed mask shared by all the maps of the same pupil and the bounding box of the
+valid pixels. The unpacked mask is kept (read-only) and shared with the maps created
+from the same pupil, so that it is unpacked only once. Processing stages work on the vector of the valid pixels (get_values)
+and masked arrays are only created for display (to_masked_array).
+
+.. note:: LEnsE - Institut d'Optique - version 1.0
+
+.. moduleauthor:: Julien VILLEMEJANE (PRAG LEnsE) <julien.villemejane@institutoptique.fr>
+Creation : october/2026
+"""
+import numpy as np
+from lensepy.optics.zygo.hariharan_algorithm import mask_bounding_box
+
+
+class PhaseMap:
+    """Phase defined on a pupil: float32 data, shared bit-packed mask and bounding box."""
+    __slots__ = ('data', 'packed_mask', 'shape', 'bbox', '_mask')
+
+    def __init__(self, data: np.ndarray, mask: np.ndarray = None, like: "PhaseMap" = None):
+        """Default constructor.
+        :param data: Phase in 2D. Masked arrays are accepted, NaN values are not valid.
+        :param mask: Boolean mask of the valid pixels. Default None, non-masked and non-NaN pixels.
+        :param like: PhaseMap whose mask is shared (mask is ignored). Default None.
+        """
+        if like is not None:
+            self._share_mask(like)
+            mask = self.get_mask()
+        else:
+            if mask is None:
+                mask = ~np.ma.getmaskarray(data) & ~np.isnan(np.ma.getdata(data))
+            mask = np.array(mask, dtype=bool)
+            mask.flags.writeable = False
+            self.shape = mask.shape
+            self.packed_mask = np.packbits(mask)
+            self.bbox = mask_bounding_box(mask)
+            self._mask = mask
+        self.data = np.zeros(self.shape, dtype=np.float32)
+        self.data[mask] = np.ma.getdata(data)[mask]
+
+    @classmethod
+    def from_values(cls, values: np.ndarray, like: "PhaseMap") -> "PhaseMap":
+        """
+        Create a map from the vector of the valid pixels, sharing the mask of another map.
+        :param values: Values of the valid pixels, in the order of get_values.
+        :param like: PhaseMap whose mask is shared.
+        :return: PhaseMap object.
+        """
+        phase_map = cls.__new__(cls)
+        phase_map._share_mask(like)
+        phase_map.data = np.zeros(like.shape, dtype=np.float32)
+        phase_map.data[phase_map.get_mask()] = values
+        return phase_map
+
+    def _share_mask(self, like: "PhaseMap"):
+        """Share the mask (packed and unpacked) of another map."""
+        like.get_mask()
+        self.packed_mask, self.shape, self.bbox, self._mask = like.packed_mask, like.shape, like.bbox, like._mask
+
+    def get_mask(self) -> np.ndarray:
+        """Return the boolean mask of the valid pixels, in 2D (read-only, shared between maps)."""
+        if self._mask is None:
+            size = self.shape[0] * self.shape[1]
+            mask = np.unpackbits(self.packed_mask, count=size).view(bool).reshape(self.shape)
+            mask.flags.writeable = False
+            self._mask = mask
+        return self._mask
+
+    def get_values(self) -> np.ndarray:
+        """Return the vector of the valid pixels, in float32."""
+        return self.data[self.get_mask()]
+
+    def get_cropped(self) -> np.ndarray:
+        """Return the data in the bounding box of the valid pixels (view)."""
+        top, bottom, left, right = self.bbox
+        return self.data[top:bottom, left:right]
+
+    def scaled(self, factor: float) -> "PhaseMap":
+        """
+        Return a new map multiplied by a factor, sharing the same mask.
+        :param factor: Multiplication factor.
+        :return: PhaseMap object.
+        """
+        phase_map = PhaseMap.__new__(PhaseMap)
+        phase_map._share_mask(self)
+        phase_map.data = self.data * np.float32(factor)
+        return phase_map
+
+    def to_masked_array(self) -> np.ma.MaskedArray:
+        """
+        Return the phase as a masked array (NaN outside the pupil), for display.
+        :return: Masked array in 2D.
+        """
+        not_mask = np.logical_not(self.get_mask())
+        data = self.data.copy()
+        data[not_mask] = np.nan
+        return np.ma.masked_array(data, mask=not_mask)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the data and of the packed mask, in bytes (the unpacked mask is shared)."""
+        return self.data.nbytes + self.packed_mask.nbytes
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""*phase_shifting.py* file.
+
+./models/phase_shifting.py contains PhaseShiftingAlgorithm class to demodulate the phase
+from any sequence of phase-shifted intensity measurements.
+
+The least-squares demodulation coefficients are processed once for a set of phase steps
+(4-step, 7-step, Carré or unequal steps calibrated from the piezo) and applied to all
+the pixels with a single matrix product.
+
+.. note:: LEnsE - Institut d'Optique - version 1.0
+
+.. moduleauthor:: Julien VILLEMEJANE (PRAG LEnsE) <julien.villemejane@institutoptique.fr>
+Creation : october/2026
+"""
+import numpy as np
+
+
+class PhaseShiftingAlgorithm:
+    """Least-squares phase demodulation for any sequence of phase steps.
+
+    Each intensity measurement is modelled by I_k = A + B * cos(phi + delta_k),
+    that is I_k = A + Bc * cos(delta_k) + Bs * sin(delta_k) with Bc = B cos(phi)
+    and Bs = -B sin(phi). (A, Bc, Bs) are obtained by the pseudo-inverse of the
+    (N, 3) design matrix, processed once for the phase steps delta_k.
+
+    The returned phase is phi, in radians, in [-π, π].
+    """
+    def __init__(self, steps):
+        """Default constructor.
+        :param steps: Phase steps delta_k of the N measurements, in radians. N >= 3.
+        """
+        self.steps = np.asarray(steps, dtype=float)
+        if self.steps.ndim != 1 or self.steps.size < 3:
+            raise ValueError('PhaseShiftingAlgorithm: at least 3 phase steps are required.')
+        design = np.column_stack([np.ones_like(self.steps), np.cos(self.steps), np.sin(self.steps)])
+        if np.linalg.matrix_rank(design) < 3:
+            raise ValueError('PhaseShiftingAlgorithm: phase steps do not allow demodulation.')
+        # Rows: A, Bc, Bs
+        self.coefficients = np.linalg.pinv(design).astype(np.float32)
+
+    @classmethod
+    def from_equal_steps(cls, number: int, step: float = np.pi / 2) -> "PhaseShiftingAlgorithm":
+        """
+        Create an algorithm for N measurements shifted by the same step.
+        :param number: Number of measurements.
+        :param step: Phase step between two measurements, in radians. Default π/2.
+        :return: PhaseShiftingAlgorithm object.
+        """
+        return cls(step * np.arange(number))
+
+    @classmethod
+    def from_carre(cls, step: float = np.pi / 2) -> "PhaseShiftingAlgorithm":
+        """
+        Create an algorithm for a Carré sequence of 4 measurements (-3, -1, 1, 3) * step / 2.
+        The step has to be known, for example calibrated from the piezo.
+        :param step: Phase step between two measurements, in radians. Default π/2.
+        :return: PhaseShiftingAlgorithm object.
+        """
+        return cls(np.array([-3, -1, 1, 3]) * step / 2)
+
+    def get_number_of_steps(self) -> int:
+        """Return the number of measurements required by the algorithm."""
+        return self.steps.size
+
+    def demodulate(self, intensity, mask: np.ndarray = None, amplitude: bool = False):
+        """
+        Demodulate the phase of a set of intensity measurements.
+        :param intensity: Stack of shape (N, H, W) or list of N arrays in 2D.
+        :param mask: Mask of shape (H, W), boolean or 0/1. Only the valid pixels are processed
+            and pixels outside the mask are set to 0. Default None.
+        :param amplitude: If True, return also the modulation amplitude B. Default False.
+        :return: Phase in float32, and modulation amplitude if required.
+        """
+        if isinstance(intensity, (list, tuple)):
+            intensity = np.stack([np.ma.getdata(image) for image in intensity])
+        intensity = np.ma.getdata(intensity)
+        if intensity.shape[0] != self.steps.size:
+            raise ValueError(f'PhaseShiftingAlgorithm: {self.steps.size} measurements are required.')
+        shape = intensity.shape[1:]
+        if mask is not None:
+            # Float 0/1 masks (as loaded from MAT files) are accepted
+            mask = np.asarray(mask, dtype=bool)
+            values = intensity[:, mask]
+        else:
+            values = intensity.reshape(self.steps.size, -1)
+        terms = self.coefficients @ values.astype(np.float32, copy=False)
+
+        phase = np.zeros(shape, dtype=np.float32)
+        phase_values = np.arctan2(-terms[2], terms[1])
+        if mask is not None:
+            phase[mask] = phase_values
+        else:
+            phase = phase_values.reshape(shape)
+        if not amplitude:
+            return phase
+        modulation = np.zeros(shape, dtype=np.float32)
+        modulation_values = np.hypot(terms[1], terms[2])
+        if mask is not None:
+            modulation[mask] = modulation_values
+        else:
+            modulation = modulation_values.reshape(shape)
+        return phase, modulation
+
+
+if __name__ == '__main__':
+    from matplotlib import pyplot as plt
+
+    y, x = np.indices((200, 300))
+    phi = np.angle(np.exp(1j * (x * 0.05 + y * 0.02)))
+    steps = np.array([0, 1.4, 3.3, 4.6, 6.2])
+    images = [100 + 50 * np.cos(phi + d) for d in steps]
+
+    algorithm = PhaseShiftingAlgorithm(steps)
+    phase = algorithm.demodulate(images)
+    plt.figure()
+    plt.imshow(phase, cmap='gray')
+    plt.colorbar()
+    plt.show()
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""*pipeline.py* file.
+
+./models/pipeline.py contains ProcessingPipeline class, a small graph of processing stages
+with memoised outputs, and ZygoPipeline, the processing chain of the Zygo application
+(cropping, wrapped phase, unwrapped phase, Zernike coefficients and PSF).
+
+A stage is processed only when its output is required and one of its dependencies has
+changed. Changing a parameter (mask, unwrapper, wedge factor...) invalidates only the
+downstream stages.
+
+.. note:: LEnsE - Institut d'Optique - version 1.0
+
+.. moduleauthor:: Julien VILLEMEJANE (PRAG LEnsE) <julien.villemejane@institutoptique.fr>
+Creation : october/2026
+"""
+import numpy as np
+from lensepy.optics.zygo.dataset import DataSetStateValue
+from lensepy.optics.zygo.phase import (PhaseModel, crop_data_set, demodulate_sets,
+                                       average_wrapped_phase, unwrap_phase_map)
+from lensepy.optics.zygo.phase_map import PhaseMap
+from lensepy.optics.zygo.psf import PSFModel
+from lensepy.optics.zygo.surface_statistics import process_statistics_surface
+from lensepy.optics.zygo.unwrapping import get_unwrapper
+from lensepy.optics.zygo.zernike_coefficients import fit_zernike_stack, surface_coefficients
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from lensepy.optics.zygo.dataset import DataSet
+
+
+class ProcessingPipeline:
+    """Graph of processing stages with memoised outputs.
+
+    Parameters are stages without function, whose value is set by set_parameter.
+    A stage function receives the outputs of its dependencies, in order, and must not
+    depend on any other state, so that a memoised output is valid until a dependency changes.
+    """
+    def __init__(self):
+        """Default constructor."""
+        self.functions = {}
+        self.dependencies = {}
+        self.dependents = {}
+        self.values = {}
+        self.states = {}
+        self.on_invalidate = None
+        self.on_process = None
+
+    def add_parameter(self, name: str, value=None):
+        """
+        Add a parameter of the pipeline.
+        :param name: Name of the parameter.
+        :param value: Initial value of the parameter.
+        """
+        self._add_node(name, None, [])
+        self.values[name] = value
+
+    def add_stage(self, name: str, function, depends_on: list[str] = None,
+                  state: DataSetStateValue = None):
+        """
+        Add a processing stage. Dependencies must be added before the stage.
+        :param name: Name of the stage.
+        :param function: Function processing the output from the outputs of its dependencies.
+        :param depends_on: Names of the dependencies. Default None.
+        :param state: DataSetStateValue set when the stage is processed and cleared when
+            it is invalidated. Default None.
+        """
+        depends_on = list(depends_on or [])
+        for dependency in depends_on:
+            if dependency not in self.functions:
+                raise ValueError(f'ProcessingPipeline: unknown dependency {dependency}.')
+        self._add_node(name, function, depends_on)
+        if state is not None:
+            self.states[name] = state
+
+    def _add_node(self, name, function, depends_on):
+        if name in self.functions:
+            raise ValueError(f'ProcessingPipeline: stage {name} already exists.')
+        self.functions[name] = function
+        self.dependencies[name] = depends_on
+        self.dependents[name] = []
+        for dependency in depends_on:
+            self.dependents[dependency].append(name)
+
+    def set_parameter(self, name: str, value):
+        """
+        Set the value of a parameter and invalidate the downstream stages.
+        :param name: Name of the parameter.
+        :param value: New value.
+        """
+        if name not in self.functions or self.functions[name] is not None:
+            raise ValueError(f'ProcessingPipeline: {name} is not a parameter.')
+        old_value = self.values.get(name)
+        if isinstance(value, np.ndarray) or isinstance(old_value, np.ndarray) or old_value != value:
+            self.values[name] = value
+            self.invalidate(name, include_self=False)
+
+    def get(self, name: str):
+        """
+        Return the output of a stage, processed with its dependencies if necessary.
+        :param name: Name of the stage or parameter.
+        :return: Output of the stage.
+        """
+        if name not in self.values:
+            arguments = [self.get(dependency) for dependency in self.dependencies[name]]
+            self.values[name] = self.functions[name](*arguments)
+            if name in self.states and self.on_process is not None:
+                self.on_process(self.states[name])
+        return self.values[name]
+
+    def is_valid(self, name: str) -> bool:
+        """
+        Check if the output of a stage is memoised.
+        :param name: Name of the stage.
+        :return: True if the output is available without processing.
+        """
+        return name in self.values
+
+    def invalidate(self, name: str, include_self: bool = True):
+        """
+        Invalidate a stage and all the stages depending on it.
+        :param name: Name of the stage or parameter.
+        :param include_self: False to keep the output of the stage itself. Default True.
+        """
+        pending = [name] if include_self else list(self.dependents[name])
+        while pending:
+            stage = pending.pop()
+            if self.functions[stage] is None:
+                continue
+            self.values.pop(stage, None)
+            if stage in self.states and self.on_invalidate is not None:
+                self.on_invalidate(self.states[stage])
+            pending.extend(self.dependents[stage])
+
+    def get_stages(self) -> list[str]:
+        """Return the names of the stages and parameters."""
+        return list(self.functions)
+
+
+class ZygoPipeline(ProcessingPipeline):
+    """Processing chain of a data set: cropped images, wrapped phase, unwrapped phase,
+    Zernike coefficients, statistics and PSF.
+
+    Each stage is a function of its inputs only : the data set is read by the cropping
+    stage, and the PhaseModel (if given) only provides the initial parameters and is
+    never modified. The wrapped phase is the complex average of all the sets of images
+    (see average_wrapped_phase), and not the demodulation of the first set as
+    PhaseModel.process_wrapped_phase.
+
+    The wedge factor only scales the outputs : the surface, the coefficients and the
+    statistics are rescaled from the memoised unwrapped phase and raw coefficients,
+    without demodulating and unwrapping again.
+    """
+    def __init__(self, data_set: "DataSet", phase: PhaseModel = None):
+        """Default constructor.
+        :param data_set: DataSet object containing images and masks.
+        :param phase: PhaseModel object, whose parameters (pre-filter, unwrapper, wedge factor)
+            are the initial parameters of the pipeline. Default None, default parameters.
+        """
+        super().__init__()
+        self.data_set = data_set
+        phase = phase if phase is not None else PhaseModel(data_set)
+        self.on_invalidate = lambda state: self.data_set.data_set_state.set_state(state, False)
+        self.on_process = lambda state: self.data_set.data_set_state.set_state(state, True)
+
+        self.add_parameter('images', 0)
+        self.add_parameter('mask', 0)
+        self.add_parameter('prefilter', (phase.prefilter_sigma, phase.prefilter_workers))
+        self.add_parameter('unwrapper', phase.unwrapper)
+        self.add_parameter('wedge_factor', phase.wedge_factor)
+        self.add_parameter('max_order', 36)
+        self.add_parameter('pad_factor', 8)
+
+        self.add_stage('cropped', self._process_cropped, ['images', 'mask', 'prefilter'],
+                       DataSetStateValue.CROPPED)
+        self.add_stage('wrapped', self._process_wrapped, ['cropped'], DataSetStateValue.WRAPPED)
+        self.add_stage('unwrapped', self._process_unwrapped, ['wrapped', 'unwrapper'],
+                       DataSetStateValue.UNWRAPPED)
+        self.add_stage('raw_coefficients', self._process_raw_coefficients,
+                       ['unwrapped', 'max_order'], DataSetStateValue.ANALYZED)
+        self.add_stage('surface', lambda unwrapped, wedge: unwrapped.scaled(-wedge),
+                       ['unwrapped', 'wedge_factor'])
+        self.add_stage('coefficients', surface_coefficients, ['raw_coefficients', 'wedge_factor'])
+        self.add_stage('statistics', process_statistics_surface, ['surface'])
+        self.add_stage('psf', self._process_psf, ['surface', 'pad_factor'])
+
+    def _process_cropped(self, images, mask, prefilter):
+        """Cropped and pre-filtered sets of images (S, 5, H, W) and cropped mask."""
+        return crop_data_set(self.data_set, *prefilter)
+
+    @staticmethod
+    def _process_wrapped(cropped):
+        """Complex average of the wrapped phases of all the sets, and modulation."""
+        images, mask = cropped
+        num, denum = demodulate_sets(images, mask)
+        return average_wrapped_phase(num, denum, mask)
+
+    @staticmethod
+    def _process_unwrapped(wrapped, unwrapper):
+        """Unwrapped phase in waves, with the modulation as quality map."""
+        wrapped_phase, modulation = wrapped
+        if isinstance(unwrapper, str):
+            unwrapper = get_unwrapper(unwrapper)
+        return unwrap_phase_map(wrapped_phase, modulation, unwrapper)
+
+    @staticmethod
+    def _process_raw_coefficients(unwrapped, max_order):
+        """Zernike coefficients of the unwrapped phase (not scaled by the wedge factor)."""
+        return fit_zernike_stack([unwrapped], max_order)[0]
+
+    @staticmethod
+    def _process_psf(surface, pad_factor):
+        psf_model = PSFModel(wavefront=surface)
+        return psf_model.get_psf(pad_factor)
+
+    def images_changed(self):
+        """Invalidate all the stages after a modification of the images of the data set."""
+        self.invalidate('images', include_self=False)
+
+    def mask_changed(self):
+        """Invalidate all the stages after a modification of the masks of the data set."""
+        self.invalidate('mask', include_self=False)
+
+    def set_prefilter(self, sigma: float, workers: int = 1):
+        """
+        Set the gaussian pre-filter of the images (see PhaseModel.set_prefilter).
+        :param sigma: Standard deviation of the gaussian, in pixels. None or 0 to disable.
+        :param workers: Number of threads to filter the sets of images. Default 1.
+        """
+        self.set_parameter('prefilter', (sigma, workers))
+
+    def set_unwrapper(self, unwrapper):
+        """
+        Set the phase unwrapping algorithm (see PhaseModel.set_unwrapper).
+        :param unwrapper: Name of the algorithm or PhaseUnwrapper object.
+        """
+        self.set_parameter('unwrapper', unwrapper)
+
+    def set_wedge_factor(self, value: float):
+        """
+        Set the wedge factor. Only the scaled outputs are invalidated.
+        :param value: Wedge factor value.
+        """
+        self.set_parameter('wedge_factor', value)
+
+    def set_max_order(self, max_order: int):
+        """
+        Set the index of the last Zernike coefficient to process.
+        :param max_order: Index of the last coefficient.
+        """
+        self.set_parameter('max_order', max_order)
+
+    def get_surface(self) -> np.ndarray:
+        """Return the unwrapped phase, scaled by the wedge factor, as a masked array for display."""
+        return self.get('surface').to_masked_array()
+
+    def get_surface_map(self) -> PhaseMap:
+        """Return the unwrapped phase, scaled by the wedge factor."""
+        return self.get('surface')
+
+    def get_coefficients(self) -> np.ndarray:
+        """Return the Zernike coefficients of the surface, scaled by the wedge factor
+        (same convention as Zernike.get_coeffs, see surface_coefficients)."""
+        return self.get('coefficients')
+
+    def get_statistics(self) -> tuple[float, float]:
+        """Return the peak-to-valley and RMS values of the surface."""
+        return self.get('statistics')
+
+    def get_psf(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return the PSF of the surface and the PSF of the perfect pupil."""
+        return self.get('psf')
+
+
+if __name__ == '__main__':
+    from lensepy.optics.zygo.dataset import DataSet
+
+    file_path = './_data/test3.mat'
+    data_set = DataSet()
+    data_set.load_images_set_from_file(file_path)
+    data_set.load_masks_from_file(file_path)
+
+    pipeline = ZygoPipeline(data_set)
+    print(f'PV / RMS = {pipeline.get_statistics()}')
+    pipeline.set_wedge_factor(0.5)
+    print(f'Unwrapped phase memoised: {pipeline.is_valid("unwrapped")}')
+    print(f'PV / RMS = {pipeline.get_statistics()}')
@@ -10,16 +10,90 @@
 Creation : april/2025
 """
 import numpy as np
+import scipy.fft
+from lensepy.optics.zygo.phase_map import PhaseMap
+from lensepy.optics.zygo.mtf import pupil_mtf
+from lensepy.optics.zygo.psf_energy import encircled_energy, ensquared_energy, radial_profile
+from lensepy.optics.zygo.surface_statistics import process_statistics_surface
+from lensepy.optics.zygo.utils import ArrayCache, mask_digest
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from lensepy.optics.zygo.phase import PhaseModel
 
-def process_statistics_surface(surface):
-    # Process (Peak-to-Valley) and RMS
-    PV = np.round(np.nanmax(surface) - np.nanmin(surface), 2)
-    RMS = np.round(np.nanstd(surface), 2)
-    return PV, RMS
+# Holds the perfect PSF and MTF of the whole padded grid (pad_factor 8) of a 1000 px pupil
+REFERENCE_CACHE_SIZE = 1024 * 2**20 # bytes
+
+# Shared cache of the PSF and MTF of perfect pupils (diffraction-limited references).
+# A reference larger than the size of the cache is not stored, and is processed again at
+# each call : (pad_factor * N)² * 8 bytes for a whole padded grid, fov² * 8 bytes with a
+# field of view.
+reference_cache = ArrayCache(REFERENCE_CACHE_SIZE)
+
+
+def get_reference(mask: np.ndarray, parameters: tuple, process) -> np.ndarray:
+    """
+    Return a reference array (PSF or MTF of the perfect pupil), from the shared cache if
+    already processed for the same mask and parameters. Arrays larger than the size of the
+    cache (see set_reference_cache_size) are not stored.
+    :param mask: Boolean mask of the pupil, in 2D.
+    :param parameters: Tuple of the parameters of the processing (method, padding, normalisation...).
+    :param process: Function without argument processing the reference array.
+    :return: Read-only array.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    key = (mask.shape, mask_digest(mask)) + tuple(parameters)
+    reference = reference_cache.get(key)
+    if reference is None:
+        reference = process()
+        reference.flags.writeable = False
+        reference_cache.put(key, reference)
+    return reference
+
+
+def set_reference_cache_size(max_bytes: int):
+    """
+    Set the maximum size of the shared cache of reference PSF and MTF.
+    :param max_bytes: Maximum size in bytes. 0 to disable the cache.
+    """
+    reference_cache.set_max_bytes(max_bytes)
+
+
+def get_reference_cache_stats() -> dict:
+    """
+    Return the statistics of the shared cache of reference PSF and MTF.
+    :return: Dictionary with number of entries, size in bytes, hits and misses.
+    """
+    return reference_cache.get_stats()
+
+
+def matrix_fourier_transform(pupil: np.ndarray, output_size: int, sampling: float,
+                             diameter: float = None, dtype=np.complex128) -> np.ndarray:
+    """
+    Process the far field of a pupil directly on a chosen output grid (matrix Fourier transform).
+
+    The field is Ay @ pupil @ Ax.T, where Ax and Ay are the Fourier kernels between the
+    pupil pixels and the output frequencies, so that the cost is O(N² M) for an output of
+    M x M pixels, instead of a FFT of the zero-padded pupil. With sampling = 1 / pad_factor
+    and diameter = N, the result is the centred M x M part of the FFT of the pupil
+    zero-padded to pad_factor * N.
+
+    :param pupil: Complex pupil in 2D.
+    :param output_size: Size M of the output grid, in pixels.
+    :param sampling: Size of an output pixel, in λ/D.
+    :param diameter: Diameter D of the pupil, in pixels. Default None, largest size of the pupil.
+    :param dtype: Complex data type of the processing. Default np.complex128.
+    :return: Complex field of M x M pixels, centred on the pixel (M // 2, M // 2).
+    """
+    height, width = pupil.shape
+    if diameter is None:
+        diameter = max(height, width)
+    # Output frequencies, in cycles per pupil pixel
+    frequencies = (np.arange(output_size) - output_size // 2) * sampling / diameter
+    kernel_x = np.exp(-2j * np.pi * np.outer(frequencies, np.arange(width))).astype(dtype)
+    kernel_y = np.exp(-2j * np.pi * np.outer(frequencies, np.arange(height))).astype(dtype)
+    return kernel_y @ (pupil.astype(dtype, copy=False) @ kernel_x.T)
+
 
 class PSFModel:
     """Class to process the Point Spread Function of a wavefront
@@ -30,54 +104,116 @@ class PSFModel:
         """
         self.phase: "PhaseModel" = phase
         self.perfect_psf = None
+        self.perfect_psf_key = None
         self.psf_real = None
+        self.fft_buffers = {}
 
         if self.phase is not None:
-            self.wavefront = self.phase.get_unwrapped_phase()
-            self.mask = self.phase.get_mask()
-        else:
-            self.wavefront = wavefront
-            self.mask = mask
-
-        self.complex_pupil = np.zeros_like(self.wavefront, dtype=complex)
-        self.complex_pupil[self.mask] = np.exp(1j * self.wavefront[self.mask])
-        self.complex_pupil = np.ma.masked_where(np.logical_not(self.mask), self.complex_pupil)
+            if hasattr(self.phase, 'get_unwrapped_map'):
+                wavefront = self.phase.get_unwrapped_map()
+            else:
+                wavefront = self.phase.get_unwrapped_phase()
+                mask = self.phase.get_mask()
+        if not isinstance(wavefront, PhaseMap):
+            wavefront = PhaseMap(wavefront, mask)
+        self.wavefront: PhaseMap = wavefront
+        self.mask = wavefront.get_mask()
+
+        # Pupil built from the vector of the valid pixels, 0 outside
+        self.complex_pupil = np.zeros(wavefront.shape, dtype=complex)
+        self.complex_pupil[self.mask] = np.exp(1j * wavefront.get_values())
         self.N_size = self.complex_pupil.shape[0]
 
-    def get_psf(self, pad_factor=8, normalized=True):
+    def get_psf(self, pad_factor=8, normalized=True, fov: int = None, dtype=np.complex128,
+                workers: int = -1):
+        """
+        Process the PSF of the wavefront and of the perfect pupil.
+
+        The pupil is zero-padded to (pad_factor * N)² and the PSF is the centred square modulus
+        of its FFT. The 2D FFT is processed in two passes (rows then columns) and only the rows
+        of the pupil and the columns and rows of the field of view are kept, so that memory is
+        set by the field of view and not by the padded size.
+
+        :param pad_factor: Zero-padding factor of the pupil. Default 8.
+        :param normalized: True to normalize each PSF by its maximum. Default True.
+        :param fov: Size of the centred field of view, in pixels of the padded grid.
+            Default None, whole padded grid. The perfect PSF is shared between instances
+            only if it fits in the reference cache (see REFERENCE_CACHE_SIZE) : a field of
+            view keeps it small for large pupils.
+        :param dtype: Complex data type of the FFT, np.complex64 to halve the memory.
+            Default np.complex128.
+        :param workers: Number of threads of scipy.fft. Default -1, all the CPU.
+        :return: PSF and perfect PSF, arrays of fov x fov.
+        """
         if self.complex_pupil is None:
-            self.get_pupil()
-        center = pad_factor * self.N_size // 2
-        half_width = self.N_size // 2
-        if self.perfect_psf is None:
-            perfect_phase = np.zeros((self.N_size, self.N_size), dtype=float)
-            perfect_complex_pupil = np.zeros_like(self.complex_pupil, dtype=complex)
-            perfect_complex_pupil[self.mask] = np.exp(1j * perfect_phase[self.mask])
-            U_padded_perfect = np.zeros((pad_factor * self.N_size, pad_factor * self.N_size), dtype=complex)
-            U_padded_perfect[self.N_size // 2:self.N_size // 2 + self.N_size, self.N_size // 2:self.N_size // 2 + self.N_size] = perfect_complex_pupil
-            self.perfect_psf = np.abs(np.fft.fftshift(np.fft.fft2(U_padded_perfect))) ** 2
-            # Centering
-            '''
-            self.perfect_psf = self.perfect_psf[
-                center - half_width:center + half_width, center - half_width:center + half_width]
-            '''
-            if normalized:
-                self.perfect_psf /= self.perfect_psf.max()
-        if self.complex_pupil is not None:
-            U_padded = np.zeros((pad_factor * self.N_size, pad_factor * self.N_size), dtype=complex)
-            U_padded[self.N_size // 2:self.N_size // 2 + self.N_size, self.N_size // 2:self.N_size // 2 + self.N_size] = self.complex_pupil
-            self.psf_real = np.abs(np.fft.fftshift(np.fft.fft2(U_padded))) ** 2
-
-            # Centering
-            '''
-            self.psf_real = self.psf_real[
-                center - half_width:center + half_width, center - half_width:center + half_width]
-            '''
-            if normalized:
-                self.psf_real /= self.psf_real.max()
+            return None, None
+        size = pad_factor * self.N_size
+        fov = size if fov is None else min(fov, size)
+
+        def process_perfect_psf():
+            perfect_psf = self._process_psf(self.mask, size, fov, dtype, workers)
+            return perfect_psf / perfect_psf.max() if normalized else perfect_psf
+
+        self.perfect_psf_key = ('psf', pad_factor, fov, normalized, np.dtype(dtype).str)
+        self.perfect_psf = get_reference(self.mask, self.perfect_psf_key, process_perfect_psf)
+        self.psf_real = self._process_psf(self.complex_pupil, size, fov, dtype, workers)
+        if normalized:
+            self.psf_real /= self.psf_real.max()
+        return self.psf_real, self.perfect_psf
+
+    def get_psf_mft(self, output_size: int = 128, sampling: float = 0.125, normalized=True,
+                    dtype=np.complex128):
+        """
+        Process the PSF of the wavefront and of the perfect pupil on a small, finely sampled
+        grid by matrix Fourier transform (see matrix_fourier_transform).
+        Same PSF as get_psf(pad_factor=1 / sampling, fov=output_size).
+        :param output_size: Size of the output grid, in pixels. Default 128.
+        :param sampling: Size of an output pixel, in λ/D (D is the size of the pupil array).
+            Default 0.125.
+        :param normalized: True to normalize each PSF by its maximum. Default True.
+        :param dtype: Complex data type of the processing. Default np.complex128.
+        :return: PSF and perfect PSF, arrays of output_size x output_size.
+        """
+        if self.complex_pupil is None:
+            return None, None
 
-            return self.psf_real, self.perfect_psf
-        return None, None
+        def process_perfect_psf():
+            field = matrix_fourier_transform(self.mask, output_size, sampling, self.N_size, dtype)
+            perfect_psf = field.real ** 2 + field.imag ** 2
+            return perfect_psf / perfect_psf.max() if normalized else perfect_psf
+
+        self.perfect_psf_key = ('mft', output_size, sampling, normalized, np.dtype(dtype).str)
+        self.perfect_psf = get_reference(self.mask, self.perfect_psf_key, process_perfect_psf)
+        field = matrix_fourier_transform(self.complex_pupil, output_size, sampling, self.N_size, dtype)
+        self.psf_real = field.real ** 2 + field.imag ** 2
+        if normalized:
+            self.psf_real /= self.psf_real.max()
+        return self.psf_real, self.perfect_psf
+
+    def _process_psf(self, pupil: np.ndarray, size: int, fov: int, dtype, workers: int) -> np.ndarray:
+        """Square modulus of the FFT of the pupil zero-padded to size x size, centred
+        and cropped to fov x fov. FFT buffers are reused between calls."""
+        height, width = pupil.shape
+        # Frequencies of the centred field of view (as after fftshift)
+        index = (np.arange(fov) - fov // 2) % size
+        rows = self._get_buffer('rows', (height, size), dtype)
+        rows[:, :width] = pupil
+        rows[:, width:] = 0
+        rows = scipy.fft.fft(rows, axis=1, overwrite_x=True, workers=workers)
+        columns = self._get_buffer('columns', (size, fov), dtype)
+        columns[:height] = rows[:, index]
+        columns[height:] = 0
+        columns = scipy.fft.fft(columns, axis=0, overwrite_x=True, workers=workers)
+        field = columns[index]
+        return field.real ** 2 + field.imag ** 2
+
+    def _get_buffer(self, name: str, shape: tuple, dtype) -> np.ndarray:
+        """Return a work buffer, allocated only if the shape or the data type changed."""
+        buffer = self.fft_buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self.fft_buffers[name] = buffer
+        return buffer
 
     def get_ftm(self, normalized=True):
         ftm_perfect = None
@@ -87,33 +223,84 @@ class PSFModel:
             if normalized:
                 ftm /= ftm.max()
             if self.perfect_psf is not None:
-                OTF_perfect = np.fft.fftshift(np.fft.fft2(self.perfect_psf))
-                ftm_perfect = np.abs(OTF_perfect)
-                if normalized:
-                    ftm_perfect /= ftm_perfect.max()
+                def process_perfect_ftm():
+                    ftm_perfect = np.abs(np.fft.fftshift(np.fft.fft2(self.perfect_psf)))
+                    return ftm_perfect / ftm_perfect.max() if normalized else ftm_perfect
+
+                ftm_perfect = get_reference(self.mask, self.perfect_psf_key + ('ftm', normalized),
+                                            process_perfect_ftm)
             return ftm, ftm_perfect
         else:
             return None, None
 
+    def get_mtf(self, field_angle: float = 90.0, dtype=np.complex128, workers: int = -1):
+        """
+        Process the MTF curves of the wavefront and of the perfect pupil, from the
+        autocorrelation of the pupil (see pupil_mtf). The PSF is not required.
+        :param field_angle: Direction of the field point, in degrees from the x axis. Default 90.
+        :param dtype: Complex data type of the FFT. Default np.complex128.
+        :param workers: Number of threads of the FFT. Default -1, all the processors.
+        :return: MTF curves of the wavefront and of the perfect pupil, structured arrays
+            (frequency, sagittal, tangential, average), frequencies in units of the cutoff.
+        """
+        if self.complex_pupil is None:
+            return None, None
+        mtf_perfect = get_reference(self.mask, ('mtf', field_angle, np.dtype(dtype).str),
+                                    lambda: pupil_mtf(self.mask, None, field_angle, dtype, workers))
+        mtf = pupil_mtf(self.complex_pupil, None, field_angle, dtype, workers)
+        return mtf, mtf_perfect
+
     def get_circled_energy(self):
-        yy, xx = np.indices(self.psf_real.shape)
-        cx, cy = self.N_size // 2, self.N_size // 2
-        rr = np.sqrt((xx - cx) ** 2 + (yy - cy) ** 2)
-        r_max = self.N_size // 2
-        encircled_energy = [self.psf_real[rr <= rad].sum() for rad in range(r_max)]
-        encircled_energy_perfect = [self.perfect_psf[rr <= rad].sum() for rad in range(r_max)]
-        encircled_energy = np.array(encircled_energy)
-        encircled_energy_perfect = np.array(encircled_energy_perfect)
-        encircled_energy /= encircled_energy.max()
-        encircled_energy_perfect /= encircled_energy_perfect.max()
-        return encircled_energy, encircled_energy_perfect
+        """
+        Process the encircled energy of the PSF and of the perfect PSF, around the optical axis
+        (centre of the PSF arrays), for radii from 0 to N / 2 pixels.
+        :return: Encircled energies of the PSF and of the perfect PSF, normalized by their maximum.
+        """
+        _, energies = encircled_energy(np.stack([self.psf_real, self.perfect_psf]),
+                                       radius_max=self.N_size // 2 - 1, normalized=False)
+        energies /= energies.max(axis=1, keepdims=True)
+        return energies[0], energies[1]
+
+    def get_encircled_energy(self, center=None, bin_width: float = 1.0, radius_max: float = None,
+                             square: bool = False):
+        """
+        Process the encircled (or ensquared) energy of the PSF and of the perfect PSF,
+        normalized by the total energy of each PSF.
+        :param center: Centre (row, column) in pixels, 'centroid' for the barycentre of each PSF.
+            Default None, optical axis (centre of the PSF arrays).
+        :param bin_width: Step of the radius, in pixels. Default 1.
+        :param radius_max: Largest radius, in pixels. Default None, whole PSF.
+        :param square: True for the ensquared energy (radius is the half-width). Default False.
+        :return: Radii, encircled energies of the PSF and of the perfect PSF.
+        """
+        if self.psf_real is None or self.perfect_psf is None:
+            return None, None, None
+        process = ensquared_energy if square else encircled_energy
+        radii, energies = process(np.stack([self.psf_real, self.perfect_psf]), center, bin_width,
+                                  radius_max)
+        return radii, energies[0], energies[1]
+
+    def get_radial_profile(self, center=None, bin_width: float = 1.0, radius_max: float = None):
+        """
+        Process the azimuthal average of the PSF and of the perfect PSF.
+        :param center: Centre (row, column) in pixels, 'centroid' for the barycentre of each PSF.
+            Default None, optical axis (centre of the PSF arrays).
+        :param bin_width: Width of the rings, in pixels. Default 1.
+        :param radius_max: Largest radius, in pixels. Default None, whole PSF.
+        :return: Radii, radial profiles of the PSF and of the perfect PSF.
+        """
+        if self.psf_real is None or self.perfect_psf is None:
+            return None, None, None
+        radii, profiles = radial_profile(np.stack([self.psf_real, self.perfect_psf]), center,
+                                         bin_width, radius_max)
+        return radii, profiles[0], profiles[1]
 
     def get_strehl_ratio(self):
         strehl = self.psf_real.max() / self.perfect_psf.max()
         return strehl
 
     def get_wavefront(self):
-        return self.wavefront
+        return self.wavefront.to_masked_array()
 
     def get_pupil(self):
         return self.complex_pupil
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""*psf_energy.py* file.
+
+./models/psf_energy.py contains the radial analysis of a PSF: azimuthal average (radial
+profile), encircled energy and ensquared energy.
+
+The distance of each pixel to the centre (sub-pixel) is binned once, and the energy of
+all the rings is processed in a single pass with np.bincount. The encircled energy is the
+cumulative sum of the rings, so that the cost is O(N²) for all the radii at once (instead of
+one sum of the PSF for each radius). A stack of PSF (K, N, N) is processed at once.
+
+.. note:: LEnsE - Institut d'Optique - version 1.0
+
+.. moduleauthor:: Julien VILLEMEJANE (PRAG LEnsE) <julien.villemejane@institutoptique.fr>
+Creation : october/2026
+"""
+import numpy as np
+
+
+def psf_centroid(psf: np.ndarray) -> np.ndarray:
+    """
+    Process the sub-pixel centre of a PSF, as the barycentre of the intensity.
+    :param psf: PSF in 2D or stack of PSF (K, N, N).
+    :return: Centre (row, column) of the PSF, or array (K, 2) for a stack.
+    """
+    psf = np.asarray(psf)
+    stack = psf if psf.ndim == 3 else psf[np.newaxis]
+    total = stack.sum(axis=(1, 2))
+    rows = stack.sum(axis=2) @ np.arange(stack.shape[1]) / total
+    columns = stack.sum(axis=1) @ np.arange(stack.shape[2]) / total
+    centers = np.stack([rows, columns], axis=1)
+    return centers if psf.ndim == 3 else centers[0]
+
+
+def radial_profile(psf: np.ndarray, center=None, bin_width: float = 1.0,
+                   radius_max: float = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Process the azimuthal average of a PSF, on rings of constant width.
+    :param psf: PSF in 2D or stack of PSF (K, N, N).
+    :param center: Centre (row, column) of the rings, in pixels (sub-pixel values accepted),
+        'centroid' for the barycentre of each PSF or array (K, 2) of centres.
+        Default None, pixel (N // 2, N // 2), optical axis of a centred PSF.
+    :param bin_width: Width of the rings, in pixels. Default 1.
+    :param radius_max: Largest radius, in pixels. Default None, largest distance to the centre.
+    :return: Tuple of radii (centres of the rings) and mean values of the rings
+        (NaN for an empty ring). Values is an array (K, number of radii) for a stack.
+    """
+    _, sums, counts, single = _bin_energy(psf, center, bin_width, radius_max, 'circle', np.rint)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        profile = sums / counts
+    radii = np.arange(profile.shape[1]) * bin_width
+    return radii, profile[0] if single else profile
+
+
+def encircled_energy(psf: np.ndarray, center=None, bin_width: float = 1.0,
+                     radius_max: float = None, normalized: bool = True) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Process the energy of a PSF inside circles of increasing radius.
+    :param psf: PSF in 2D or stack of PSF (K, N, N).
+    :param center: Centre of the circles (see radial_profile). Default None, pixel (N // 2, N // 2).
+    :param bin_width: Step of the radius, in pixels. Default 1.
+    :param radius_max: Largest radius, in pixels. Default None, largest distance to the centre.
+    :param normalized: True to divide by the total energy of each PSF. Default True.
+    :return: Tuple of radii and energies of the pixels at a distance lower or equal to each
+        radius. Energies is an array (K, number of radii) for a stack.
+    """
+    return _cumulated_energy(psf, center, bin_width, radius_max, normalized, 'circle')
+
+
+def ensquared_energy(psf: np.ndarray, center=None, bin_width: float = 1.0,
+                     radius_max: float = None, normalized: bool = True) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Process the energy of a PSF inside squares of increasing half-width.
+    :param psf: PSF in 2D or stack of PSF (K, N, N).
+    :param center: Centre of the squares (see radial_profile). Default None, pixel (N // 2, N // 2).
+    :param bin_width: Step of the half-width, in pixels. Default 1.
+    :param radius_max: Largest half-width, in pixels. Default None, largest distance to the centre.
+    :param normalized: True to divide by the total energy of each PSF. Default True.
+    :return: Tuple of half-widths and energies of the squares. Energies is an array
+        (K, number of half-widths) for a stack.
+    """
+    return _cumulated_energy(psf, center, bin_width, radius_max, normalized, 'square')
+
+
+def _cumulated_energy(psf, center, bin_width, radius_max, normalized, metric):
+    """Cumulative sum of the energy of the rings (pixels at distance <= radius)."""
+    totals, sums, _, single = _bin_energy(psf, center, bin_width, radius_max, metric, np.ceil)
+    energy = np.cumsum(sums, axis=1)
+    if normalized:
+        energy /= totals[:, np.newaxis]
+    radii = np.arange(energy.shape[1]) * bin_width
+    return radii, energy[0] if single else energy
+
+
+def _bin_energy(psf, center, bin_width, radius_max, metric, rounding):
+    """
+    Sum the PSF on rings of distance to the centre.
+    :return: Tuple of total energies (K,), sums (K, bins) and pixel counts (K, bins) of the
+        rings, and True for a single PSF.
+    """
+    psf = np.asarray(psf)
+    single = psf.ndim == 2
+    stack = psf[np.newaxis] if single else psf
+    number, height, width = stack.shape
+    if center is None:
+        centers = np.array([[height // 2, width // 2]], dtype=float)
+    elif isinstance(center, str) and center == 'centroid':
+        centers = psf_centroid(stack)
+    else:
+        centers = np.asarray(center, dtype=float).reshape(-1, 2)
+    if centers.shape[0] not in (1, number):
+        raise ValueError('psf_energy: one centre or one centre per PSF is required.')
+    if radius_max is None:
+        corners = np.abs(np.concatenate([centers, centers - [height - 1, width - 1]], axis=1))
+        if metric == 'circle':
+            radius_max = np.hypot(corners[:, [0, 2]].max(axis=1), corners[:, [1, 3]].max(axis=1)).max()
+        else:
+            radius_max = corners.max()
+    bins = int(rounding(radius_max / bin_width)) + 1
+
+    totals = stack.sum(axis=(1, 2), dtype=float)
+    sums = np.empty((number, bins))
+    counts = np.empty((number, bins))
+    index = None
+    for k in range(number):
+        if index is None or centers.shape[0] > 1:
+            index = _ring_index((height, width), centers[min(k, centers.shape[0] - 1)],
+                                bin_width, bins, metric, rounding)
+            count = np.bincount(index, minlength=bins + 1)[:bins]
+        # Pixels further than radius_max are in the last (dropped) bin
+        sums[k] = np.bincount(index, weights=stack[k].ravel(), minlength=bins + 1)[:bins]
+        counts[k] = count
+    return totals, sums, counts, single
+
+
+def _ring_index(shape: tuple, center: np.ndarray, bin_width: float, bins: int,
+                metric: str, rounding) -> np.ndarray:
+    """Return the ring index of each pixel (flat), bins for the pixels out of the last ring."""
+    dy = np.abs(np.arange(shape[0]) - center[0])[:, np.newaxis]
+    dx = np.abs(np.arange(shape[1]) - center[1])[np.newaxis, :]
+    distance = np.hypot(dy, dx) if metric == 'circle' else np.maximum(dy, dx)
+    index = rounding(distance / bin_width).astype(np.intp).ravel()
+    return np.minimum(index, bins, out=index)
+
+
+if __name__ == '__main__':
+    import time
+    y, x = np.indices((512, 512))
+    r = np.hypot(x - 256.3, y - 255.8) / 8
+    psfs = np.stack([np.sinc(r * (1 + 0.01 * k)) ** 2 for k in range(100)])
+    start = time.perf_counter()
+    radii, energies = encircled_energy(psfs, center='centroid', radius_max=128)
+    print(f'Encircled energy of {len(psfs)} PSF in {(time.perf_counter() - start) * 1e3:.1f} ms')
+    print(f'EE(8 px) = {energies[:3, 8]}')
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""*streaming.py* file.
+
+./models/streaming.py contains StreamingPhaseMeasurement class, to process the wavefront
+continuously from a stream of phase-shifted frames (for alignment).
+
+The last N frames are kept in a preallocated ring buffer (valid pixels only). Each new
+frame replaces the oldest one, which has the same phase step : the demodulation terms
+are updated with the difference of the two frames, then the phase is unwrapped and the
+low-order Zernike coefficients are fitted with the cached pseudo-inverse of the basis.
+Results are published to callbacks, with the latency of each stage.
+
+.. note:: LEnsE - Institut d'Optique - version 1.0
+
+.. moduleauthor:: Julien VILLEMEJANE (PRAG LEnsE) <julien.villemejane@institutoptique.fr>
+Creation : october/2026
+"""
+import time
+from collections import deque
+import numpy as np
+from lensepy.optics.zygo.hariharan_algorithm import mask_bounding_box
+from lensepy.optics.zygo.phase_map import PhaseMap
+from lensepy.optics.zygo.phase_shifting import PhaseShiftingAlgorithm
+from lensepy.optics.zygo.unwrapping import LeastSquaresUnwrapper, get_unwrapper
+from lensepy.optics.zygo.zernike_coefficients import get_pseudo_inverse
+
+# Number of frames between two complete processing of the demodulation terms
+REFRESH_PERIOD = 100
+
+
+class StreamingPhaseMeasurement:
+    """Continuous phase measurement from a stream of phase-shifted frames."""
+    stages = ['buffer', 'demodulation', 'unwrapping', 'fit', 'total']
+
+    def __init__(self, mask: np.ndarray, algorithm: PhaseShiftingAlgorithm = None,
+                 max_order: int = 4, unwrapper=None, statistics_size: int = 100):
+        """Default constructor.
+        :param mask: Boolean mask of the pupil, same size as the frames.
+        :param algorithm: Phase shifting algorithm. Frame k of the stream has the phase step
+            k modulo N of the algorithm, if the step is not given to add_frame.
+            Default None, 5 steps of π/2.
+        :param max_order: Index of the last Zernike coefficient to fit. Default 4 (defocus).
+        :param unwrapper: Name of the unwrapping algorithm or PhaseUnwrapper. Default None,
+            least-squares starting from the previous solution.
+        :param statistics_size: Number of frames for the latency statistics. Default 100.
+        """
+        self.algorithm = algorithm if algorithm is not None else PhaseShiftingAlgorithm.from_equal_steps(5)
+        if unwrapper is None:
+            unwrapper = LeastSquaresUnwrapper(tolerance=1e-3, warm_start=True)
+        self.unwrapper = get_unwrapper(unwrapper) if isinstance(unwrapper, str) else unwrapper
+        mask = np.asarray(mask, dtype=bool)
+        top, bottom, left, right = mask_bounding_box(mask)
+        self.bbox = (slice(top, bottom), slice(left, right))
+        self.mask = mask[self.bbox]
+        self.mask_map = PhaseMap(np.zeros(self.mask.shape, dtype=np.float32), self.mask)
+        self.max_order = max_order
+        self.pseudo_inverse = get_pseudo_inverse(self.mask, max_order).astype(np.float32)
+
+        # Preallocated buffers
+        number = self.algorithm.get_number_of_steps()
+        n_valid = np.count_nonzero(self.mask)
+        self.frames = np.zeros((number, n_valid), dtype=np.float32)
+        self.terms = np.zeros((3, n_valid), dtype=np.float32)
+        self.work = np.empty((3, n_valid), dtype=np.float32)
+        self.new_frame = np.empty(n_valid, dtype=np.float32)
+        self.wrapped = np.zeros(self.mask.shape, dtype=np.float32)
+        self.frame_counter = 0
+
+        self.callbacks = []
+        self.latency = {stage: deque(maxlen=statistics_size) for stage in self.stages}
+        self.last_result = None
+
+    def add_callback(self, callback):
+        """
+        Add a function called with the result (dictionary) of each processed frame.
+        :param callback: Function with one argument.
+        """
+        self.callbacks.append(callback)
+
+    def reset(self):
+        """Empty the ring buffer and the latency statistics."""
+        self.frames.fill(0)
+        self.terms.fill(0)
+        self.frame_counter = 0
+        self.last_result = None
+        for latency in self.latency.values():
+            latency.clear()
+
+    def is_ready(self) -> bool:
+        """Return True if the ring buffer contains a complete set of frames."""
+        return self.frame_counter >= self.algorithm.get_number_of_steps()
+
+    def add_frame(self, frame: np.ndarray, step: int = None) -> dict:
+        """
+        Add a new frame to the ring buffer and process the wavefront.
+        :param frame: Intensity, same size as the mask, in any data type.
+        :param step: Index of the phase step of the frame. Default None, number of frames
+            added since the last reset, modulo the number of steps.
+        :return: Result dictionary (see get_last_result). None if the buffer is not full yet.
+        """
+        start = time.perf_counter()
+        number = self.algorithm.get_number_of_steps()
+        slot = self.frame_counter % number if step is None else step
+        if not 0 <= slot < number:
+            raise ValueError(f'add_frame: phase step {slot} out of the {number} steps of the algorithm.')
+        np.copyto(self.new_frame, frame[self.bbox][self.mask], casting='unsafe')
+        # Update of the demodulation terms with the difference to the oldest frame
+        self.frames[slot] -= self.new_frame
+        np.multiply(self.algorithm.coefficients[:, slot, np.newaxis], self.frames[slot], out=self.work)
+        self.terms -= self.work
+        self.frames[slot] = self.new_frame
+        self.frame_counter += 1
+        if self.frame_counter % REFRESH_PERIOD == 0:
+            np.matmul(self.algorithm.coefficients, self.frames, out=self.terms)
+        times = {'buffer': time.perf_counter() - start}
+        if not self.is_ready():
+            return None
+
+        step = time.perf_counter()
+        wrapped_values = np.arctan2(-self.terms[2], self.terms[1])
+        modulation_values = np.hypot(self.terms[1], self.terms[2])
+        times['demodulation'] = time.perf_counter() - step
+
+        step = time.perf_counter()
+        self.wrapped[self.mask] = wrapped_values
+        quality = np.zeros(self.mask.shape, dtype=np.float32)
+        quality[self.mask] = modulation_values
+        unwrapped = self.unwrapper.unwrap(self.wrapped, self.mask, quality=quality)
+        surface_values = (unwrapped[self.mask] / (2 * np.pi)).astype(np.float32)
+        times['unwrapping'] = time.perf_counter() - step
+
+        step = time.perf_counter()
+        coefficients = self.pseudo_inverse @ surface_values
+        times['fit'] = time.perf_counter() - step
+        times['total'] = time.perf_counter() - start
+
+        for stage, duration in times.items():
+            self.latency[stage].append(duration)
+        self.last_result = {
+            'frame': self.frame_counter,
+            'coefficients': coefficients,
+            'surface': PhaseMap.from_values(surface_values, like=self.mask_map),
+            'modulation': PhaseMap.from_values(modulation_values, like=self.mask_map),
+            'latency': times,
+        }
+        for callback in self.callbacks:
+            callback(self.last_result)
+        return self.last_result
+
+    def get_last_result(self) -> dict:
+        """
+        Return the result of the last processed frame.
+        :return: Dictionary with frame (number of frames received), coefficients (Zernike
+            coefficients up to max_order, in waves), surface and modulation (PhaseMap, in the
+            bounding box of the mask) and latency (duration of each stage, in seconds).
+            None if no frame was processed.
+        """
+        return self.last_result
+
+    def get_latency_statistics(self) -> dict:
+        """
+        Return the latency statistics of each stage on the last processed frames.
+        :return: Dictionary {stage: {'mean', 'max', 'last'}}, in milliseconds.
+        """
+        statistics = {}
+        for stage, latency in self.latency.items():
+            if latency:
+                values = np.asarray(latency) * 1e3
+                statistics[stage] = {'mean': values.mean(), 'max': values.max(), 'last': values[-1]}
+        return statistics
+
+
+if __name__ == '__main__':
+    y, x = np.indices((400, 400))
+    pupil = (x - 200) ** 2 + (y - 200) ** 2 < 180 ** 2
+    measurement = StreamingPhaseMeasurement(pupil)
+    steps = measurement.algorithm.steps
+    for k in range(50):
+        tilt = 0.03 + 0.001 * k
+        frame = (120 + 80 * np.cos(tilt * x + steps[k % steps.size])).astype(np.uint8)
+        result = measurement.add_frame(frame)
+    print(f'Coefficients = {result["coefficients"].round(3)}')
+    for stage, values in measurement.get_latency_statistics().items():
+        print(f'{stage:<14} mean = {values["mean"]:.2f} ms / max = {values["max"]:.2f} ms')
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""*surface_statistics.py* file.
+
+./models/surface_statistics.py contains the statistics of surfaces (or wavefronts):
+peak-to-valley (PV), RMS, mean value and robust PV.
+
+Statistics are processed on the vector of the valid pixels (not masked and not NaN),
+for a single surface or for a stack of surfaces (N, H, W) at once.
+Extremes, mean and RMS are processed in one pass over the pixels, by cache-sized chunks :
+the moments of each chunk are centred on its own mean (in float64) and merged with the
+previous ones (Chan et al.), so that the RMS is accurate even for a large offset.
+The robust PV is the difference between the percentiles containing a given fraction of
+the valid pixels (for example 99.5 %), so that a few outliers do not change its value.
+It requires a partial sort of the pixels, in addition to the pass of the moments.
+
+.. note:: LEnsE - Institut d'Optique - version 1.0
+
+.. moduleauthor:: Julien VILLEMEJANE (PRAG LEnsE) <julien.villemejane@institutoptique.fr>
+Creation : october/2026
+"""
+import numpy as np
+from lensepy.optics.zygo.phase_map import PhaseMap
+
+# Fraction of the valid pixels used for the robust PV, in %
+ROBUST_PV_PERCENTILE = 99.5
+# Number of values (all the surfaces) processed together by the pass of the moments
+STATISTICS_CHUNK_SIZE = 2**16
+
+surface_statistics_dtype = np.dtype([('pv', float), ('rms', float), ('mean', float),
+                                     ('robust_pv', float)])
+
+
+def surface_statistics(surface, mask: np.ndarray = None, percentile: float = ROBUST_PV_PERCENTILE,
+                       decimals: int = None):
+    """
+    Process the statistics of a surface or of a stack of surfaces.
+    :param surface: Surface in 2D (array or masked array), vector of the valid pixels,
+        PhaseMap, stack of surfaces (N, H, W) or list of PhaseMap sharing the same mask.
+    :param mask: Boolean mask of the valid pixels, in 2D. Default None, pixels not masked.
+        NaN pixels are never valid.
+    :param percentile: Fraction of the valid pixels for the robust PV, in %. Default 99.5.
+        None to skip the robust PV (NaN), which requires a partial sort of the pixels.
+    :param decimals: Number of decimals to round the results. Default None, no rounding.
+    :return: Structured record (pv, rms, mean, robust_pv) for a single surface,
+        structured array of shape (N,) for a stack. NaN values if no pixel is valid.
+    """
+    values, single = _valid_values(surface, mask)
+    statistics = np.full(values.shape[0], np.nan, dtype=surface_statistics_dtype)
+    if values.shape[1] > 0:
+        count, minimum, maximum, mean, m2 = _moments(values)
+        valid = count > 0
+        statistics['pv'][valid] = (maximum - minimum)[valid]
+        statistics['rms'][valid] = np.sqrt(m2[valid] / count[valid])
+        statistics['mean'][valid] = mean[valid]
+        if percentile is not None and np.any(valid):
+            quantiles = [(100 - percentile) / 200, (100 + percentile) / 200]
+            if np.all(count[valid] == values.shape[1]):
+                low, high = np.quantile(values[valid], quantiles, axis=1)
+            else:
+                low, high = np.nanquantile(values[valid], quantiles, axis=1)
+            statistics['robust_pv'][valid] = high - low
+    if decimals is not None:
+        for name in surface_statistics_dtype.names:
+            statistics[name] = np.round(statistics[name], decimals)
+    return statistics[0] if single else statistics
+
+
+def _moments(values: np.ndarray) -> tuple[np.ndarray, ...]:
+    """
+    Process the number of valid (not NaN) values, minimum, maximum, mean and sum of the
+    squared deviations to the mean of each row, in one pass by chunks of columns.
+    """
+    rows, size = values.shape
+    count = np.zeros(rows)
+    mean = np.zeros(rows)
+    m2 = np.zeros(rows)
+    minimum = np.full(rows, np.inf)
+    maximum = np.full(rows, -np.inf)
+    step = max(1, STATISTICS_CHUNK_SIZE // rows)
+    for start in range(0, size, step):
+        chunk = values[:, start:start + step].astype(float)
+        nan = np.isnan(chunk)
+        if nan.any():
+            chunk_count = chunk.shape[1] - nan.sum(axis=1)
+            # fmin and fmax ignore NaN
+            np.fmin(minimum, np.fmin.reduce(chunk, axis=1), out=minimum)
+            np.fmax(maximum, np.fmax.reduce(chunk, axis=1), out=maximum)
+            chunk[nan] = 0
+            with np.errstate(invalid='ignore', divide='ignore'):
+                chunk_mean = np.where(chunk_count > 0, chunk.sum(axis=1) / chunk_count, 0)
+            chunk -= chunk_mean[:, np.newaxis]
+            chunk[nan] = 0
+        else:
+            chunk_count = np.full(rows, chunk.shape[1])
+            np.minimum(minimum, chunk.min(axis=1), out=minimum)
+            np.maximum(maximum, chunk.max(axis=1), out=maximum)
+            chunk_mean = chunk.mean(axis=1)
+            chunk -= chunk_mean[:, np.newaxis]
+        chunk_m2 = np.einsum('ij,ij->i', chunk, chunk)
+        # Merge of the centred moments of the chunk
+        total = count + chunk_count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(total > 0, chunk_count / total, 0)
+        delta = chunk_mean - mean
+        mean += delta * weight
+        m2 += chunk_m2 + delta ** 2 * count * weight
+        count = total
+    return count, minimum, maximum, mean, m2
+
+
+def process_statistics_surface(surface):
+    # Process (Peak-to-Valley) and RMS
+    statistics = surface_statistics(surface, percentile=None, decimals=2)
+    return statistics['pv'], statistics['rms']
+
+
+def _valid_values(surface, mask: np.ndarray = None) -> tuple[np.ndarray, bool]:
+    """Return the valid pixels as a (N, number of pixels) array, and True for a single surface."""
+    if isinstance(surface, PhaseMap):
+        return surface.get_values()[np.newaxis, :], True
+    if isinstance(surface, (list, tuple)):
+        if all(isinstance(s, PhaseMap) and s.packed_mask is surface[0].packed_mask for s in surface):
+            return np.stack([s.get_values() for s in surface]), False
+        surface = np.ma.stack([s.to_masked_array() if isinstance(s, PhaseMap) else s for s in surface])
+    single = np.ndim(surface) < 3
+    data = np.ma.getdata(surface)
+    if np.ndim(surface) == 1:
+        return data[np.newaxis, :], True
+    if single:
+        data = data[np.newaxis]
+    if np.ma.getmask(surface) is np.ma.nomask:
+        if mask is None:
+            return data.reshape(data.shape[0], -1), single
+        return data[:, np.asarray(mask, dtype=bool)], single
+    valid = np.ones(data.shape[1:], dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+    surface_mask = np.ma.getmaskarray(surface)
+    if np.ndim(surface) == 3:
+        # Pixels masked in some of the surfaces are set to NaN in the others
+        values = data[:, valid]
+        if surface_mask[:, valid].any():
+            values = values.astype(float)
+            values[surface_mask[:, valid]] = np.nan
+        return values, single
+    return data[:, valid & ~surface_mask], single
+
+
+if __name__ == '__main__':
+    y, x = np.indices((512, 512))
+    pupil = (x - 256) ** 2 + (y - 256) ** 2 < 250 ** 2
+    surfaces = np.stack([np.sin(x / 50 + k) + 0.01 * k for k in range(100)])
+    surfaces[:, 10, 256] = 10           # Outlier
+    results = surface_statistics(surfaces, pupil)
+    print(f'PV = {results["pv"][:3]}')
+    print(f'Robust PV = {results["robust_pv"][:3]}')
+    print(f'RMS = {results["rms"][:3]}')
@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+"""*unwrapping.py* file.
+
+./models/unwrapping.py contains phase unwrapping algorithms, sharing the same interface,
+to be used by PhaseModel:
+
+- SkimageUnwrapper: reliability-sorting algorithm from skimage.restoration (default),
+- LeastSquaresUnwrapper: least-squares unwrapping solved by DCT (Ghiglia and Romero),
+  preconditioned conjugate gradient for masks and weights,
+- QualityGuidedUnwrapper: unwrapping along a maximum spanning tree of a quality map,
+  for example the modulation of the Hariharan algorithm,
+- TiledUnwrapper: overlapping tiles unwrapped in a process pool by one of the previous
+  algorithms, and stitched by resolving the 2π offsets on the overlaps.
+
+benchmark_unwrappers times each algorithm and checks its accuracy on synthetic surfaces.
+
+.. note:: LEnsE - Institut d'Optique - version 1.0
+
+.. moduleauthor:: Julien VILLEMEJANE (PRAG LEnsE) <julien.villemejane@institutoptique.fr>
+Creation : october/2026
+"""
+import os
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.fft import dctn, idctn, next_fast_len
+from scipy.ndimage import uniform_filter, label
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import minimum_spanning_tree, connected_components, breadth_first_order
+from skimage.restoration import unwrap_phase
+
+
+def wrap_phase(phase: np.ndarray) -> np.ndarray:
+    """
+    Wrap a phase in [-π, π[.
+    :param phase: Phase in radians.
+    :return: Wrapped phase.
+    """
+    return (phase + np.pi) % (2 * np.pi) - np.pi
+
+
+class PhaseUnwrapper(ABC):
+    """Base class of the phase unwrapping algorithms.
+    Subclasses implement unwrap(wrapped, mask, quality).
+    """
+    name = ''
+
+    @abstractmethod
+    def unwrap(self, wrapped: np.ndarray, mask: np.ndarray = None,
+               quality: np.ndarray = None) -> np.ndarray:
+        """
+        Unwrap a phase.
+        :param wrapped: Wrapped phase in radians, in 2D.
+        :param mask: Boolean mask of the valid pixels. Default None, all the pixels.
+        :param quality: Quality map (higher is better), for example the modulation. Default None.
+        :return: Unwrapped phase in radians, 0 outside the mask.
+        """
+
+
+class SkimageUnwrapper(PhaseUnwrapper):
+    """Reliability-sorting unwrapping algorithm from skimage.restoration.unwrap_phase."""
+    name = 'skimage'
+
+    def unwrap(self, wrapped, mask=None, quality=None):
+        wrapped = np.ma.getdata(wrapped)
+        if mask is not None:
+            wrapped = np.ma.masked_where(np.logical_not(mask), np.where(mask, wrapped, 0))
+        unwrapped = unwrap_phase(wrapped)
+        return np.ma.filled(unwrapped, 0)
+
+
+class LeastSquaresUnwrapper(PhaseUnwrapper):
+    """Least-squares unwrapping of the wrapped phase gradients (Ghiglia and Romero, 1994).
+
+    Without mask and quality, the Poisson equation is solved by a single DCT.
+    Otherwise, the weighted problem (weights 0 outside the mask) is solved by a conjugate
+    gradient preconditioned by the DCT solver. The result is made congruent with the
+    wrapped phase (differs by a multiple of 2π) if congruent is True. With warm_start,
+    the conjugate gradient starts from the previous solution of the same size (continuous
+    measurement of a slowly varying phase).
+    """
+    name = 'least_squares'
+
+    def __init__(self, max_iterations: int = 50, tolerance: float = 1e-6, congruent: bool = True,
+                 warm_start: bool = False):
+        """Default constructor.
+        :param max_iterations: Maximum number of iterations of the conjugate gradient. Default 50.
+        :param tolerance: Relative residual to stop the conjugate gradient. Default 1e-6.
+        :param congruent: True to make the result congruent with the wrapped phase. Default True.
+        :param warm_start: True to start from the previous solution. Default False.
+        """
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.congruent = congruent
+        self.warm_start = warm_start
+        self.last_solution = None
+
+    def unwrap(self, wrapped, mask=None, quality=None):
+        wrapped = np.ma.getdata(wrapped).astype(float)
+        weights = None
+        if mask is not None:
+            weights = np.asarray(mask, dtype=float)
+        if quality is not None:
+            quality = np.ma.getdata(quality).astype(float)
+            quality_max = quality.max()
+            # Unit weights if the quality is 0 everywhere
+            if quality_max > 0:
+                quality /= quality_max
+                weights = quality if weights is None else weights * quality
+        if weights is not None:
+            wrapped = wrapped * (weights > 0)
+        dx = wrap_phase(np.diff(wrapped, axis=1))
+        dy = wrap_phase(np.diff(wrapped, axis=0))
+        if weights is None:
+            unwrapped = _solve_poisson(_divergence(dx, dy))
+        else:
+            # Weight of an edge between two pixels
+            wx = np.minimum(weights[:, 1:], weights[:, :-1])
+            wy = np.minimum(weights[1:, :], weights[:-1, :])
+            unwrapped = self._solve_weighted(dx, dy, wx, wy)
+        if self.congruent:
+            unwrapped = wrapped + 2 * np.pi * np.round((unwrapped - wrapped) / (2 * np.pi))
+        if mask is not None:
+            unwrapped[np.logical_not(mask)] = 0
+        return unwrapped
+
+    def _solve_weighted(self, dx, dy, wx, wy) -> np.ndarray:
+        """Preconditioned conjugate gradient on the weighted normal equations."""
+        def operator(phi):
+            return _divergence(wx * np.diff(phi, axis=1), wy * np.diff(phi, axis=0))
+
+        rhs = _divergence(wx * dx, wy * dy)
+        norm_rhs = np.linalg.norm(rhs)
+        if norm_rhs == 0:
+            return np.zeros_like(rhs)
+        if self.warm_start and self.last_solution is not None and self.last_solution.shape == rhs.shape:
+            phi = self.last_solution
+            residual = rhs - operator(phi)
+        else:
+            phi = np.zeros_like(rhs)
+            residual = rhs.copy()
+        z = _solve_poisson(residual, fast=True)
+        direction = z.copy()
+        rz = np.vdot(residual, z)
+        for _ in range(self.max_iterations):
+            a_direction = operator(direction)
+            alpha = rz / np.vdot(direction, a_direction)
+            phi += alpha * direction
+            residual -= alpha * a_direction
+            if np.linalg.norm(residual) < self.tolerance * norm_rhs:
+                break
+            z = _solve_poisson(residual, fast=True)
+            rz_new = np.vdot(residual, z)
+            direction = z + (rz_new / rz) * direction
+            rz = rz_new
+        if self.warm_start:
+            self.last_solution = phi.copy()
+        return phi
+
+
+class QualityGuidedUnwrapper(PhaseUnwrapper):
+    """Quality-guided unwrapping along a maximum spanning tree of the quality map.
+
+    The phase is integrated from the best pixel along the edges of highest quality,
+    as the flood-fill algorithm of quality-guided unwrapping. The tree is processed
+    with scipy.sparse.csgraph and the integration by pointer jumping, without loop
+    on the pixels. If no quality map is given, the local coherence of the wrapped
+    phase (modulus of the mean phasor in a 3x3 window) is used.
+    """
+    name = 'quality'
+
+    def unwrap(self, wrapped, mask=None, quality=None):
+        wrapped = np.ma.getdata(wrapped).astype(float)
+        height, width = wrapped.shape
+        if mask is None:
+            mask = np.ones(wrapped.shape, dtype=bool)
+        mask = np.asarray(mask, dtype=bool)
+        if quality is None:
+            quality = np.hypot(uniform_filter(np.cos(wrapped), 3), uniform_filter(np.sin(wrapped), 3))
+        quality = np.ma.getdata(quality).astype(float)
+
+        # Graph of the valid pixels, edges between 4-neighbours
+        index = np.full(wrapped.shape, -1)
+        index[mask] = np.arange(np.count_nonzero(mask))
+        rows, cols, costs = [], [], []
+        for first, second in [((slice(None), slice(None, -1)), (slice(None), slice(1, None))),
+                              ((slice(None, -1), slice(None)), (slice(1, None), slice(None)))]:
+            valid = mask[first] & mask[second]
+            rows.append(index[first][valid])
+            cols.append(index[second][valid])
+            # Lowest cost for the best edges, strictly positive
+            costs.append(1 / (1e-12 + quality[first][valid] + quality[second][valid]))
+        n_valid = index.max() + 1
+        graph = coo_matrix((np.concatenate(costs), (np.concatenate(rows), np.concatenate(cols))),
+                           shape=(n_valid, n_valid)).tocsr()
+        tree = minimum_spanning_tree(graph)
+
+        # Predecessors in the tree, from the best pixel of each connected part
+        values = wrapped[mask]
+        quality_values = quality[mask]
+        predecessors = np.arange(n_valid)
+        _, labels = connected_components(tree, directed=False)
+        order = np.argsort(-quality_values, kind='stable')
+        _, first = np.unique(labels[order], return_index=True)
+        for root in order[first]:
+            nodes, tree_predecessors = breadth_first_order(tree, root, directed=False,
+                                                           return_predecessors=True)
+            predecessors[nodes[1:]] = tree_predecessors[nodes[1:]]
+
+        # Integration of the wrapped differences by pointer jumping
+        offsets = wrap_phase(values - values[predecessors])
+        while np.any(predecessors != predecessors[predecessors]):
+            offsets = offsets + offsets[predecessors]
+            predecessors = predecessors[predecessors]
+        unwrapped = np.zeros(wrapped.shape)
+        unwrapped[mask] = values[predecessors] + offsets
+        return unwrapped
+
+
+class TiledUnwrapper(PhaseUnwrapper):
+    """Unwrapping of overlapping tiles in a process pool, stitched on the overlaps.
+
+    Each tile is unwrapped by the base unwrapper in a separate process. Each connected
+    part of the mask in a tile is a region ; the 2π offset between two regions is the
+    rounded median of their difference on the overlap. Offsets are integrated along a
+    maximum spanning tree of the regions, weighted by the number of common pixels.
+
+    .. note:: As any process pool, the main module has to be protected by
+        if __name__ == '__main__' on Windows.
+    """
+    name = 'tiled'
+
+    def __init__(self, unwrapper='skimage', tile_size: int = 512, overlap: int = 32,
+                 workers: int = None):
+        """Default constructor.
+        :param unwrapper: Name of the base algorithm or PhaseUnwrapper object. Default 'skimage'.
+        :param tile_size: Size of the square tiles, in pixels. Default 512.
+        :param overlap: Overlap between two neighbouring tiles, in pixels. Default 32.
+        :param workers: Number of processes. Default None, number of CPU.
+        """
+        if overlap < 1 or overlap >= tile_size:
+            raise ValueError('TiledUnwrapper: overlap must be in [1, tile_size[.')
+        if isinstance(unwrapper, str):
+            unwrapper = get_unwrapper(unwrapper)
+        self.unwrapper = unwrapper
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.workers = workers if workers is not None else os.cpu_count()
+
+    def get_tiles(self, shape: tuple) -> list[tuple[slice, slice]]:
+        """
+        Return the slices of the overlapping tiles covering an array.
+        :param shape: Shape of the array (H, W).
+        :return: List of (rows, columns) slices.
+        """
+        step = self.tile_size - self.overlap
+        starts = [[0] if size <= self.tile_size else
+                  list(range(0, size - self.tile_size, step)) + [size - self.tile_size]
+                  for size in shape]
+        return [(slice(y, y + self.tile_size), slice(x, x + self.tile_size))
+                for y in starts[0] for x in starts[1]]
+
+    def unwrap(self, wrapped, mask=None, quality=None):
+        wrapped = np.ma.getdata(wrapped)
+        if mask is None:
+            mask = np.ones(wrapped.shape, dtype=bool)
+        mask = np.asarray(mask, dtype=bool)
+        tiles = [tile for tile in self.get_tiles(wrapped.shape) if np.any(mask[tile])]
+        if len(tiles) <= 1 or self.workers <= 1:
+            if len(tiles) <= 1:
+                return self.unwrapper.unwrap(wrapped, mask, quality)
+            results = [_unwrap_tile(self.unwrapper, wrapped[tile], mask[tile],
+                                    None if quality is None else np.ma.getdata(quality)[tile])
+                       for tile in tiles]
+        else:
+            qualities = [None if quality is None else np.ma.getdata(quality)[tile] for tile in tiles]
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(tiles))) as executor:
+                results = list(executor.map(_unwrap_tile, [self.unwrapper] * len(tiles),
+                                            [wrapped[tile] for tile in tiles],
+                                            [mask[tile] for tile in tiles], qualities))
+        return self._stitch(wrapped.shape, tiles, results)
+
+    def _stitch(self, shape, tiles, results) -> np.ndarray:
+        """Resolve the 2π offsets between the regions of the tiles and merge them."""
+        # Regions: connected parts of the mask in each tile, with a global number
+        labels, first_region = [], [0]
+        for _, region_labels, number in results:
+            labels.append(np.where(region_labels > 0, region_labels + first_region[-1] - 1, -1))
+            first_region.append(first_region[-1] + number)
+        n_regions = first_region[-1]
+
+        # Offsets between regions on the overlaps of the tiles
+        rows, cols, counts, offsets = [], [], [], {}
+        for i, tile_i in enumerate(tiles):
+            for j in range(i + 1, len(tiles)):
+                tile_j = tiles[j]
+                common = tuple(slice(max(a.start, b.start), min(a.stop, b.stop))
+                               for a, b in zip(tile_i, tile_j))
+                if any(c.start >= c.stop for c in common):
+                    continue
+                local_i = tuple(slice(c.start - a.start, c.stop - a.start) for c, a in zip(common, tile_i))
+                local_j = tuple(slice(c.start - b.start, c.stop - b.start) for c, b in zip(common, tile_j))
+                label_i, label_j = labels[i][local_i], labels[j][local_j]
+                valid = (label_i >= 0) & (label_j >= 0)
+                if not np.any(valid):
+                    continue
+                difference = (results[i][0][local_i] - results[j][0][local_j])[valid]
+                pairs = label_i[valid] * n_regions + label_j[valid]
+                for pair in np.unique(pairs):
+                    selected = pairs == pair
+                    region_i, region_j = divmod(int(pair), n_regions)
+                    rows.append(region_i)
+                    cols.append(region_j)
+                    counts.append(np.count_nonzero(selected))
+                    offsets[(region_i, region_j)] = np.round(np.median(difference[selected]) / (2 * np.pi))
+
+        # Integration of the offsets along a maximum spanning tree of the regions
+        steps = np.zeros(n_regions)
+        if rows:
+            graph = coo_matrix((1 / np.asarray(counts, dtype=float), (rows, cols)),
+                               shape=(n_regions, n_regions)).tocsr()
+            tree = minimum_spanning_tree(graph)
+            done = np.zeros(n_regions, dtype=bool)
+            for root in range(n_regions):
+                if done[root]:
+                    continue
+                nodes, predecessors = breadth_first_order(tree, root, directed=False,
+                                                          return_predecessors=True)
+                done[nodes] = True
+                for node in nodes[1:]:
+                    parent = predecessors[node]
+                    if (parent, node) in offsets:
+                        steps[node] = steps[parent] + offsets[(parent, node)]
+                    else:
+                        steps[node] = steps[parent] - offsets[(node, parent)]
+
+        unwrapped = np.zeros(shape)
+        for tile, (values, _, _), region_labels in zip(tiles, results, labels):
+            valid = region_labels >= 0
+            unwrapped[tile][valid] = values[valid] + 2 * np.pi * steps[region_labels[valid]]
+        return unwrapped
+
+
+def _unwrap_tile(unwrapper: PhaseUnwrapper, wrapped, mask, quality):
+    """Unwrap a tile and label the connected parts of its mask (process pool task)."""
+    region_labels, number = label(mask)
+    return unwrapper.unwrap(wrapped, mask, quality), region_labels, number
+
+
+UNWRAPPERS = {
+    SkimageUnwrapper.name: SkimageUnwrapper,
+    LeastSquaresUnwrapper.name: LeastSquaresUnwrapper,
+    QualityGuidedUnwrapper.name: QualityGuidedUnwrapper,
+    TiledUnwrapper.name: TiledUnwrapper,
+}
+
+
+def get_unwrapper(name: str = 'skimage', **kwargs) -> PhaseUnwrapper:
+    """
+    Create a phase unwrapper from its name.
+    :param name: Name of the algorithm ('skimage', 'least_squares', 'quality' or 'tiled').
+        Default 'skimage'.
+    :param kwargs: Parameters of the unwrapper.
+    :return: PhaseUnwrapper object.
+    """
+    if name not in UNWRAPPERS:
+        raise ValueError(f'get_unwrapper: unknown unwrapper {name}, '
+                         f'available: {", ".join(UNWRAPPERS)}.')
+    return UNWRAPPERS[name](**kwargs)
+
+
+def _divergence(gx: np.ndarray, gy: np.ndarray) -> np.ndarray:
+    """Transpose of the forward differences, applied to the gradients (gx, gy)."""
+    height, width = gy.shape[0] + 1, gx.shape[1] + 1
+    div = np.zeros((height, width))
+    div[:, 1:] += gx
+    div[:, :-1] -= gx
+    div[1:, :] += gy
+    div[:-1, :] -= gy
+    return -div
+
+
+def _solve_poisson(rhs: np.ndarray, fast: bool = False) -> np.ndarray:
+    """Solve the discrete Poisson equation with Neumann boundaries, by DCT. Zero mean solution.
+    If fast, the grid is padded with zeros to a size efficient for the DCT (approximate solution,
+    used as preconditioner)."""
+    if fast:
+        shape = rhs.shape
+        padded = np.zeros([next_fast_len(size, real=True) for size in shape])
+        padded[:shape[0], :shape[1]] = rhs
+        return _solve_poisson(padded)[:shape[0], :shape[1]]
+    height, width = rhs.shape
+    eigen_y = 2 * np.cos(np.pi * np.arange(height) / height) - 2
+    eigen_x = 2 * np.cos(np.pi * np.arange(width) / width) - 2
+    eigen = eigen_y[:, np.newaxis] + eigen_x[np.newaxis, :]
+    eigen[0, 0] = 1
+    solution = dctn(rhs, type=2, norm='ortho') / eigen
+    solution[0, 0] = 0
+    return idctn(solution, type=2, norm='ortho')
+
+
+def synthetic_surface(size: int = 512, annular: bool = False, noise: float = 0.0, seed: int = 0):
+    """
+    Generate a synthetic wrapped phase (tilt, defocus, astigmatism and coma) on a circular pupil.
+    The modulation of the fringes decreases towards the edge of the pupil and in a
+    low-contrast spot, and the phase noise is inversely proportional to the modulation.
+    :param size: Size of the square surface, in pixels. Default 512.
+    :param annular: True to add a central obstruction. Default False.
+    :param noise: Standard deviation of the phase noise where the modulation is 1, in radians.
+        Default 0.
+    :param seed: Seed of the random generator. Default 0.
+    :return: Wrapped phase, true phase, mask and modulation (from 0 to 1).
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.indices((size, size))
+    x = (x - size / 2) / (size / 2.2)
+    y = (y - size / 2) / (size / 2.2)
+    r2 = x ** 2 + y ** 2
+    mask = r2 < 1
+    if annular:
+        mask &= r2 > 0.1
+    phase = 2 * np.pi * (6 * x + 3 * y + 4 * (2 * r2 - 1) + 2 * (x ** 2 - y ** 2) + 1.5 * (3 * r2 - 2) * y)
+    spot = np.exp(-((x - 0.4) ** 2 + (y + 0.3) ** 2) / 0.02)
+    modulation = np.clip(1 - 0.6 * r2 ** 2, 0.1, 1) * (1 - 0.85 * spot)
+    wrapped = wrap_phase(phase + rng.normal(0, 1, phase.shape) * noise / modulation)
+    return wrapped, phase, mask, modulation
+
+
+def benchmark_unwrappers(sizes: tuple = (256, 512, 1024), unwrappers: list = None,
+                         noise: float = 0.2, repeat: int = 3) -> list[dict]:
+    """
+    Time the phase unwrappers and check their accuracy on synthetic surfaces.
+    The modulation of the fringes is given to the unwrappers as quality map.
+    :param sizes: Sizes of the square surfaces, in pixels. Default (256, 512, 1024).
+    :param unwrappers: List of PhaseUnwrapper objects. Default one of each algorithm.
+    :param noise: Standard deviation of the phase noise, in radians. Default 0.2.
+    :param repeat: Number of runs, the best time is kept. Default 3.
+    :return: List of dictionaries (unwrapper, size, pupil, time in s, rms_error in rad,
+        wrong_pixels as the fraction of pixels with an error of 2π or more).
+    """
+    if unwrappers is None:
+        unwrappers = [unwrapper() for unwrapper in UNWRAPPERS.values()]
+    results = []
+    for size in sizes:
+        for annular in [False, True]:
+            wrapped, phase, mask, modulation = synthetic_surface(size, annular, noise)
+            for unwrapper in unwrappers:
+                times = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    unwrapped = unwrapper.unwrap(wrapped, mask, quality=modulation)
+                    times.append(time.perf_counter() - start)
+                error = (unwrapped - phase)[mask]
+                error -= np.median(error)
+                results.append({'unwrapper': unwrapper.name, 'size': size,
+                                'pupil': 'annular' if annular else 'circular',
+                                'time': min(times), 'rms_error': float(np.std(error)),
+                                'wrong_pixels': float(np.mean(np.abs(error) > np.pi))})
+    return results
+
+
+if __name__ == '__main__':
+    print(f'{"Unwrapper":<15}{"Size":>6}{"Pupil":>10}{"Time (ms)":>12}{"RMS (rad)":>12}{"Wrong (%)":>12}')
+    for result in benchmark_unwrappers():
+        print(f'{result["unwrapper"]:<15}{result["size"]:>6}{result["pupil"]:>10}'
+              f'{result["time"] * 1e3:>12.1f}{result["rms_error"]:>12.4f}'
+              f'{result["wrong_pixels"] * 100:>12.2f}')
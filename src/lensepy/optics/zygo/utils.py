@@ -1,4 +1,7 @@
 import os
+import hashlib
+import threading
+from collections import OrderedDict
 import numpy as np
 import scipy
 
@@ -77,3 +80,109 @@ def split_3d_array(array_3d, size: int = 5):
     # Extract the 2D arrays
     arrays = [array_3d[:, :, i].astype(np.float32) for i in range(array_3d.shape[2])]
     return arrays
+
+
+def mask_digest(mask: np.ndarray) -> str:
+    """
+    Return a digest identifying a mask, from its shape and its content.
+    :param mask: Boolean mask in 2D.
+    :return: Hexadecimal digest of the mask.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    digest = hashlib.sha1(str(mask.shape).encode())
+    digest.update(np.packbits(mask).tobytes())
+    return digest.hexdigest()
+
+
+class ArrayCache:
+    """Least-recently-used cache of arrays, bounded by a size in bytes.
+    Values are arrays or objects with a nbytes attribute.
+    """
+    def __init__(self, max_bytes: int = 512 * 2**20):
+        """Default constructor.
+        :param max_bytes: Maximum size of the stored values, in bytes.
+        """
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        """
+        Return a stored value and mark it as recently used.
+        :param key: Key of the value.
+        :param default: Value returned if the key is not stored. Default None.
+        :return: Stored value or default.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """
+        Store a value, evicting the least recently used values if necessary.
+        A value larger than the maximum size is not stored.
+        :param key: Key of the value.
+        :param value: Value to store.
+        :return: True if the value is stored.
+        """
+        nbytes = int(getattr(value, 'nbytes', 0))
+        with self.lock:
+            if key in self.entries:
+                self.current_bytes -= self.sizes.pop(key)
+                del self.entries[key]
+            if nbytes > self.max_bytes:
+                if self.max_bytes > 0:
+                    print(f'ArrayCache: value of {nbytes / 2**20:.0f} MB not stored, larger than '
+                          f'the cache ({self.max_bytes / 2**20:.0f} MB).')
+                return False
+            self.entries[key] = value
+            self.sizes[key] = nbytes
+            self.current_bytes += nbytes
+            self._evict()
+            return True
+
+    def set_max_bytes(self, max_bytes: int):
+        """
+        Set the maximum size of the cache, evicting values if necessary.
+        :param max_bytes: Maximum size of the stored values, in bytes.
+        """
+        with self.lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """Remove all the values and reset the counters."""
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.current_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self) -> dict:
+        """
+        Return the statistics of the cache.
+        :return: Dictionary with hits, misses, entries, bytes and max_bytes.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries),
+                'bytes': self.current_bytes, 'max_bytes': self.max_bytes}
+
+    def _evict(self):
+        """Remove the least recently used values until the size is under the limit."""
+        while self.current_bytes > self.max_bytes and len(self.entries) > 0:
+            key, _ = self.entries.popitem(last=False)
+            self.current_bytes -= self.sizes.pop(key)
@@ -20,7 +20,11 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), ".")))
 import matplotlib.pyplot as plt
 import numpy as np
 import math
+from scipy.linalg import solve_triangular
 from lensepy.optics.zygo.dataset import DataSet
+from lensepy.optics.zygo.phase_map import PhaseMap
+from lensepy.optics.zygo.utils import ArrayCache, mask_digest
+from lensepy.utils import downsample_array
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
@@ -78,8 +82,408 @@ aberrations_list = [
 ]
 
 COEFFICIENTS_ROUND_RANGE = 4 # decimals
+# Holds the masked basis, its pseudo-inverse and the whole grid polynomials of a 1414 px
+# (2 Mpx) surface, for 37 polynomials in float64
+BASIS_CACHE_SIZE = 2048 * 2**20 # bytes
+ORTHONORMAL_TOLERANCE = 1e-8 # relative norm under which a polynomial is linearly dependent
+RANK_TOLERANCE = 1e-6 # relative singular value under which the masked basis is rank deficient
+QR_CHUNK_SIZE = 8 # number of columns added to the QR factor when it is full
+BASIS_CHUNK_SIZE = 2**16 # number of pixels of the masked basis processed at once
+
+
+
+def cartesian_polynomial(noll_index: int, X: np.ndarray, Y: np.ndarray,
+                         pow1: np.ndarray = None, pow2: np.ndarray = None) -> np.ndarray:
+    '''Normalized (RMS) Zernike polynomial on a cartesian grid.
+    :param noll_index: Index of the polynomial (0 for piston).
+    :param X: X-coordinates of the grid, normalized in [-1, 1].
+    :param Y: Y-coordinates of the grid, normalized in [-1, 1].
+    :param pow1: X**2 - Y**2, if already calculated. Default None.
+    :param pow2: X**2 + Y**2, if already calculated. Default None.
+    :return: Polynomial evaluated on the grid.
+    '''
+    if pow1 is None:
+        pow1 = X**2 - Y**2
+    if pow2 is None:
+        pow2 = X**2 + Y**2
+    if noll_index == 0:     # Piston
+        return np.ones_like(X)
+    elif noll_index == 1:   # x-Tilt
+        return 2*X
+    elif noll_index == 2:   # y-Tilt
+        return 2*Y
+    elif noll_index == 3:   # defocus
+        return np.sqrt(3)*(2*pow2 - 1)
+    ## ORDER 3
+    elif noll_index == 4:   # defocus / 45d primary astig
+        return 2*np.sqrt(6)*(X * Y)
+    elif noll_index == 5:   # defocus / 0d primary astig
+        return np.sqrt(6)*pow1
+    elif noll_index == 6:   # Primary coma
+        return np.sqrt(8)*Y*(3*pow2-2)
+    elif noll_index == 7:   # Primary coma
+        return np.sqrt(8)*X*(3*pow2-2)
+    elif noll_index == 8:   # Primary coma
+        return np.sqrt(8)*Y*(3*X**2 - Y**2)
+    ## ORDER 5
+    elif noll_index == 9:   # Primary coma
+        return np.sqrt(8)*X*(X**2 - 3*Y**2)
+    elif noll_index == 10:   # Primary Spherical Aber.
+        return np.sqrt(5)*(6*pow2**2 - 6*pow2 + 1)
+    elif noll_index == 11:   # Primary Spherical Aber.
+        return np.sqrt(10)*pow1*(4*pow2 - 3)
+    elif noll_index == 12:   # Primary Spherical Aber.
+        return 2*np.sqrt(10)*X*Y*(4*pow2 - 3)
+    elif noll_index == 13:   # Primary Spherical Aber.
+        return np.sqrt(10)*(pow2**2 - 8*X**2*Y**2)
+    elif noll_index == 14:   # Primary Spherical Aber.
+        return 4*np.sqrt(10)*X*Y*pow1
+    elif noll_index == 15:   # Secondary coma
+        return np.sqrt(12)*X*(10*(pow2)**2 - 12*(pow2) + 3)
+    ## ORDER 7
+    elif noll_index == 16:   # Secondary coma
+        return np.sqrt(12)*Y*(10*(pow2)**2 - 12*(pow2) + 3)
+    elif noll_index == 17:   # Secondary coma
+        return np.sqrt(12)*X*(X**2 - 3*Y**2)*(5*pow2 - 4)
+    elif noll_index == 18:   # Secondary coma
+        return np.sqrt(12)*Y*(3 * X**2 - Y**2)*(5*pow2 - 4)
+    elif noll_index == 19:   # Secondary coma
+        return np.sqrt(12)*X*(16*X**4 - 20*X**2*pow2 + 5*pow2**2)
+    elif noll_index == 20:   # Secondary coma
+        return np.sqrt(12)*Y*(16*Y**4 - 20*Y**2*pow2 + 5*pow2**2)
+    elif noll_index == 21:   # Secondary Spherical Aber.
+        return np.sqrt(7)*(20*pow2**3 - 30*pow2**2 + 12*pow2 - 1)
+    elif noll_index == 22:   # Secondary Spherical Aber.
+        return 2*np.sqrt(14)*X*Y*(15*pow2**2 - 20*pow2 + 6)
+    elif noll_index == 23:   # Secondary Spherical Aber.
+        return np.sqrt(14)*pow1*(15*pow2**2 - 20*pow2 + 6)
+    elif noll_index == 24:   # Secondary Spherical Aber.
+        return 4*np.sqrt(14)*X*Y*pow1*(6*pow2 - 5)
+    ## ORDER 9
+    elif noll_index == 25:   # Secondary Spherical Aber.
+        return np.sqrt(14)*(pow2**2 - 8*X**2*Y**2)*(6*pow2 - 5)
+    elif noll_index == 26:   # Secondary Spherical Aber.
+        return np.sqrt(14)*X*Y*(32*X**4 - 32*X**2*pow2 + 6*pow2**2)
+    elif noll_index == 27:   # Secondary Spherical Aber.
+        return np.sqrt(14)*(32*X**6 - 48*X**4*pow2 + 18*X**2*pow2**2 - pow2**3)
+
+    elif noll_index == 28:   # Secondary Spherical Aber.
+        return 4*Y*(35*pow2**3-60*pow2**2+30*pow2-4)
+    elif noll_index == 29:   # Secondary Spherical Aber.
+        return 4*X*(35*pow2**3-60*pow2**2+30*pow2-4)
+    elif noll_index == 30:   # Tertiary y-Coma
+        return 4*Y*(3*X**2-Y**2)*(21*pow2**2-30*pow2+10)
+    elif noll_index == 31:   # Tertiary x-Coma
+        return 4*X*(X**2-3*Y**2)*(21*pow2**2-30*pow2+10)
+    elif noll_index == 32:   # Secondary Spherical Aber.
+        return 4*(4*X**2*Y*pow1+Y*pow2**2-8*X**2*Y**3)*(7*pow2-6)
+    elif noll_index == 33:   # Secondary Spherical Aber.
+        return 4*(X*pow2**2-8*X**3*Y**2-4*X*Y**2*pow1)*(7*pow2-6)
+    elif noll_index == 34:   # Secondary Spherical Aber.
+        return 8*X**2*Y*(3*pow2**2-16*X**2*Y**2)+4*Y*pow1*(pow2**2-16*X**2*Y**2)
+    elif noll_index == 35:   # Secondary Spherical Aber.
+        return 4*X*pow1*(pow2**2-16*X**2*Y**2)-8*X*Y**2*(3*pow2**2-16*X**2*Y**2)
+
+    ## ORDER 11
+    elif noll_index == 36: # Tertiary spherical
+        return 3*(70*pow2**4-140*pow2**3 +90*pow2**2-20*pow2+1)
+    ## Higher orders, Noll index = noll_index + 1
+    else:
+        return zernike_basis_cartesian(noll_index + 1, X, Y, first_mode=noll_index + 1)[0]
+
+
+def cartesian_basis(max_order: int, X: np.ndarray, Y: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """
+    Normalized (RMS) Zernike polynomials from index 0 to max_order, stacked on the first axis.
+    All the polynomials are processed by the recurrence of zernike_basis_cartesian, that gives
+    the same values as cartesian_polynomial.
+    :param max_order: Index of the last polynomial.
+    :param X: X-coordinates, normalized in [-1, 1].
+    :param Y: Y-coordinates, normalized in [-1, 1].
+    :param out: Preallocated array of shape (max_order + 1, *X.shape). Default None.
+    :return: Array of shape (max_order + 1, *X.shape).
+    """
+    # Noll index = index + 1
+    return zernike_basis_cartesian(max_order + 1, X, Y, out=out)
+
+
+def grid_coordinates(shape: tuple) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Return the coordinates of a grid, normalized in [-1, 1] on each axis.
+    :param shape: Shape (rows, columns) of the grid.
+    :return: X and Y coordinates, 2D arrays of the shape of the grid.
+    """
+    a, b = shape
+    return np.meshgrid(np.linspace(-1, 1, b), np.linspace(-1, 1, a))
 
 
+class ZernikeBasis:
+    """Zernike polynomials evaluated on the valid pixels of a mask.
+    The coordinates of the grid are normalized in [-1, 1] on each axis (see grid_coordinates).
+    Polynomials on the whole grid are given by get_zernike_stack.
+    """
+    def __init__(self, mask: np.ndarray, max_order: int = 36, dtype=np.float64):
+        """Default constructor.
+        :param mask: Boolean mask of the valid pixels, in 2D.
+        :param max_order: Index of the last polynomial. Default 36.
+        :param dtype: Data type of the polynomials. Default np.float64.
+        """
+        self.mask = np.asarray(mask, dtype=bool)
+        self.max_order = max_order
+        self.dtype = np.dtype(dtype)
+        X, Y = grid_coordinates(self.mask.shape)
+        X, Y = X[self.mask], Y[self.mask]
+        # Polynomials on the valid pixels only, one column per polynomial, by chunks of pixels
+        self.matrix = np.empty((X.size, max_order + 1), dtype=self.dtype)
+        buffer = np.empty((max_order + 1, min(X.size, BASIS_CHUNK_SIZE)), dtype=self.dtype)
+        for start in range(0, X.size, BASIS_CHUNK_SIZE):
+            stop = min(start + BASIS_CHUNK_SIZE, X.size)
+            chunk = cartesian_basis(max_order, X[start:stop], Y[start:stop],
+                                    out=buffer[:, :stop - start])
+            self.matrix[start:stop] = chunk.T
+        # Shared between Zernike objects
+        self.matrix.flags.writeable = False
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the stored arrays, in bytes."""
+        return self.matrix.nbytes + self.mask.nbytes
+
+    def get_number_of_modes(self) -> int:
+        """Return the number of polynomials of the basis."""
+        return self.max_order + 1
+
+
+class OrthonormalBasis:
+    """Zernike basis orthonormalized over the valid pixels of a mask.
+
+    Polynomials are orthonormalized by a QR factorization (Gram-Schmidt in the
+    order of the indexes), so each mode is the part of a Zernike polynomial that
+    is orthogonal to the previous ones on the mask. Modes are RMS-normalized over
+    the mask, as the analytic polynomials over the unit disk. A ValueError is raised
+    if a polynomial is linearly dependent on the previous ones on the mask.
+    """
+    def __init__(self, basis: ZernikeBasis, max_order: int = None):
+        """Default constructor.
+        :param basis: Zernike basis on the mask.
+        :param max_order: Index of the last polynomial. Default max_order of the basis.
+        """
+        if max_order is None or max_order > basis.max_order:
+            max_order = basis.max_order
+        self.max_order = max_order
+        self.mask = basis.mask
+        matrix = basis.matrix[:, :max_order + 1]
+        n_valid = matrix.shape[0]
+        q, r = np.linalg.qr(matrix)
+        diagonal = np.diag(r)
+        # Norm of each polynomial orthogonally to the previous ones
+        dependent = np.abs(diagonal) <= ORTHONORMAL_TOLERANCE * np.linalg.norm(matrix, axis=0)
+        if dependent.any():
+            raise ValueError('OrthonormalBasis: Zernike polynomials '
+                             f'{np.flatnonzero(dependent).tolist()} are linearly dependent on the mask.')
+        signs = np.sign(diagonal)
+        # matrix = self.matrix @ self.transform
+        self.matrix = q * (signs * np.sqrt(n_valid))
+        self.transform = r * (signs[:, np.newaxis] / np.sqrt(n_valid))
+        self.matrix.flags.writeable = False
+        self.transform.flags.writeable = False
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the stored arrays, in bytes."""
+        return self.matrix.nbytes + self.transform.nbytes
+
+    def project(self, values: np.ndarray) -> np.ndarray:
+        """
+        Process the coefficients of the orthonormal modes, by a dot product per mode.
+        :param values: Values on the valid pixels, 1D array or 2D array (N, number of valid pixels).
+        :return: Coefficients of the orthonormal modes, last axis is the mode.
+        """
+        return values @ self.matrix / self.matrix.shape[0]
+
+    def to_noll(self, orthonormal_coeffs: np.ndarray) -> np.ndarray:
+        """
+        Convert coefficients of the orthonormal modes to coefficients of the Zernike polynomials.
+        :param orthonormal_coeffs: Coefficients of the orthonormal modes, last axis is the mode.
+        :return: Coefficients of the Zernike polynomials, last axis of size max_order + 1.
+        """
+        orthonormal_coeffs = np.asarray(orthonormal_coeffs)
+        return solve_triangular(self.transform, orthonormal_coeffs.T).T
+
+    def get_modes_stack(self) -> np.ndarray:
+        """
+        Return the orthonormal modes on the whole grid of the mask (0 outside the mask).
+        :return: 3D array of shape (number of modes, H, W).
+        """
+        stack = np.zeros((self.max_order + 1,) + self.mask.shape)
+        stack[:, self.mask] = self.matrix.T
+        return stack
+
+
+basis_cache = ArrayCache(BASIS_CACHE_SIZE)
+
+
+def get_zernike_basis(mask: np.ndarray, max_order: int = 36, dtype=np.float64) -> ZernikeBasis:
+    """
+    Return the Zernike basis of a mask, from the shared cache if already processed.
+    :param mask: Boolean mask of the valid pixels, in 2D.
+    :param max_order: Index of the last polynomial. Default 36.
+    :param dtype: Data type of the polynomials. Default np.float64.
+    :return: ZernikeBasis object.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    key = (mask.shape, mask_digest(mask), max_order, np.dtype(dtype).str)
+    basis = basis_cache.get(key)
+    if basis is None:
+        basis = ZernikeBasis(mask, max_order, dtype)
+        basis_cache.put(key, basis)
+    return basis
+
+
+def get_zernike_stack(shape: tuple, max_order: int = 36, dtype=np.float64) -> np.ndarray:
+    """
+    Return the Zernike polynomials on a whole grid, from the shared cache if already processed.
+    The polynomials do not depend on the mask, so the stack is shared by all the masks of a grid.
+    :param shape: Shape (rows, columns) of the grid.
+    :param max_order: Index of the last polynomial. Default 36.
+    :param dtype: Data type of the polynomials. Default np.float64.
+    :return: Read-only array of shape (max_order + 1, rows, columns).
+    """
+    key = (tuple(shape), max_order, np.dtype(dtype).str, 'stack')
+    stack = basis_cache.get(key)
+    if stack is None:
+        X, Y = grid_coordinates(shape)
+        stack = cartesian_basis(max_order, X, Y, out=np.empty((max_order + 1,) + tuple(shape), dtype=dtype))
+        stack.flags.writeable = False
+        basis_cache.put(key, stack)
+    return stack
+
+
+def get_pseudo_inverse(mask: np.ndarray, max_order: int = 36, dtype=np.float64) -> np.ndarray:
+    """
+    Return the pseudo-inverse of the masked Zernike basis, from the shared cache if already processed.
+    :param mask: Boolean mask of the valid pixels, in 2D.
+    :param max_order: Index of the last polynomial. Default 36.
+    :param dtype: Data type of the polynomials. Default np.float64.
+    :return: 2D array of shape (max_order + 1, number of valid pixels).
+    """
+    mask = np.asarray(mask, dtype=bool)
+    key = (mask.shape, mask_digest(mask), max_order, np.dtype(dtype).str, 'pinv')
+    pseudo_inverse = basis_cache.get(key)
+    if pseudo_inverse is None:
+        basis = get_zernike_basis(mask, max_order, dtype)
+        u, s, vt = np.linalg.svd(basis.matrix, full_matrices=False)
+        check_rank(np.count_nonzero(s > RANK_TOLERANCE * s[0]), max_order + 1, 'get_pseudo_inverse')
+        pseudo_inverse = (vt.T / s) @ u.T
+        pseudo_inverse.flags.writeable = False
+        basis_cache.put(key, pseudo_inverse)
+    return pseudo_inverse
+
+
+def check_rank(rank: int, n_modes: int, name: str):
+    """
+    Raise a ValueError if the Zernike polynomials are not linearly independent on the mask,
+    as the least-squares coefficients would not be unique.
+    :param rank: Number of independent polynomials on the mask.
+    :param n_modes: Number of polynomials.
+    :param name: Name of the calling function, for the message.
+    """
+    if rank < n_modes:
+        raise ValueError(f'{name}: the Zernike basis is rank deficient on the mask '
+                         f'({rank} independent polynomials out of {n_modes}).')
+
+
+def get_orthonormal_basis(mask: np.ndarray, max_order: int = 36,
+                          basis: ZernikeBasis = None) -> OrthonormalBasis:
+    """
+    Return the Zernike basis orthonormalized over a mask, from the shared cache if already processed.
+    Any mask can be used, for example an annular mask from MasksSet.get_global_cropped_mask.
+    :param mask: Boolean mask of the valid pixels, in 2D.
+    :param max_order: Index of the last polynomial. Default 36.
+    :param basis: Zernike basis already processed on the same mask. Default None.
+    :return: OrthonormalBasis object.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    key = (mask.shape, mask_digest(mask), max_order, np.dtype(np.float64).str, 'orthonormal')
+    orthonormal = basis_cache.get(key)
+    if orthonormal is None:
+        if basis is None or basis.max_order < max_order:
+            basis = get_zernike_basis(mask, max_order)
+        orthonormal = OrthonormalBasis(basis, max_order)
+        basis_cache.put(key, orthonormal)
+    return orthonormal
+
+
+def surface_coefficients(coeffs, wedge_factor: float, fitted_wedge_factor: float = None) -> np.ndarray:
+    """
+    Return the Zernike coefficients of the surface, in waves. The surface is the unwrapped
+    phase (in waves) scaled by -wedge_factor, as displayed (see PhaseModel.get_unwrapped_map).
+    :param coeffs: Coefficients fitted on the unwrapped phase or on a surface already scaled
+        by -fitted_wedge_factor. None values are NaN.
+    :param wedge_factor: Current wedge factor.
+    :param fitted_wedge_factor: Wedge factor of the fitted surface. Default None, coefficients
+        of the unwrapped phase.
+    :return: Array of the coefficients of the surface.
+    """
+    coeffs = np.array(coeffs, dtype=float)
+    if fitted_wedge_factor is None:
+        return -coeffs * wedge_factor
+    return coeffs * (wedge_factor / fitted_wedge_factor)
+
+
+def fit_zernike_stack(surfaces, max_order: int = 36, mask: np.ndarray = None) -> np.ndarray:
+    """
+    Process the Zernike coefficients of a stack of surfaces sharing the same mask.
+
+    All the surfaces are fitted at once by applying the cached pseudo-inverse
+    of the masked basis in a single matrix product. Coefficients are the same
+    as the ones of Zernike.fit_all on each surface.
+
+    :param surfaces: Array of shape (N, H, W), list of 2D (masked) arrays, of PhaseMap
+        or of PhaseModel. PhaseMaps sharing the same mask are fitted from their valid pixels.
+    :param max_order: Index of the last coefficient to process. Default 36.
+    :param mask: Boolean mask of the valid pixels. Default None, pixels that are valid
+        (not NaN and not masked) in all the surfaces.
+    :return: 2D array of shape (N, max_order + 1).
+    """
+    if isinstance(surfaces, (list, tuple)):
+        surfaces = [s.get_unwrapped_map() if hasattr(s, 'get_unwrapped_map') else
+                    s.get_unwrapped_phase() if hasattr(s, 'get_unwrapped_phase') else s
+                    for s in surfaces]
+        if mask is None and all(isinstance(s, PhaseMap) and s.packed_mask is surfaces[0].packed_mask
+                                for s in surfaces):
+            values = np.stack([s.get_values() for s in surfaces])
+            return values @ get_pseudo_inverse(surfaces[0].get_mask(), max_order).T
+        surfaces = [s.to_masked_array() if isinstance(s, PhaseMap) else s for s in surfaces]
+        if mask is None:
+            mask = np.logical_and.reduce([~np.ma.getmaskarray(s) for s in surfaces])
+        stack = np.stack([np.ma.getdata(s) for s in surfaces])
+    else:
+        if mask is None:
+            mask = ~np.ma.getmaskarray(surfaces).any(axis=0)
+        stack = np.ma.getdata(surfaces)
+    if stack.ndim != 3:
+        raise ValueError('fit_zernike_stack: surfaces must be a stack of 2D arrays.')
+    mask = np.asarray(mask, dtype=bool) & ~np.isnan(stack).any(axis=0)
+    pseudo_inverse = get_pseudo_inverse(mask, max_order)
+    return stack[:, mask] @ pseudo_inverse.T
+
+
+def set_basis_cache_size(max_bytes: int):
+    """
+    Set the maximum size of the shared cache of Zernike basis.
+    :param max_bytes: Maximum size in bytes. 0 to disable the cache.
+    """
+    basis_cache.set_max_bytes(max_bytes)
+
+
+def get_basis_cache_stats() -> dict:
+    """
+    Return the statistics (hits, misses, entries, bytes) of the shared cache of Zernike basis.
+    :return: Dictionary of statistics.
+    """
+    return basis_cache.get_stats()
+
 
 class Zernike:
     """
@@ -93,6 +497,7 @@ class Zernike:
         self.max_order: int = max_order
         self.phase: "PhaseModel" = phase
         self.surface = self.phase.get_unwrapped_phase()
+        self.surface_wedge_factor = 1.0
         self.lambda_value = 0       # Value of the wavelength
         self.lambda_nm = False      # If False, display in lambda else in um
 
@@ -100,7 +505,10 @@ class Zernike:
         self.coeff_counter = 0
         self.coeff_calculated = False  # Zernike coefficients are calculated
         self.coeff_list = [None] * (self.max_order + 1)
+        self.orthonormal_coeffs = None
         self.polynomials = [None] * (self.max_order + 1)
+        self.reset_factorization()
+        self.basis: ZernikeBasis = None
         self.X = None
         self.Y = None
         self.pow1 = None
@@ -152,103 +560,34 @@ class Zernike:
         """
         if self.phase.is_analysis_ready():
             self.surface = self.phase.get_unwrapped_phase()
-            # Dimensions of the surface
-            a, b = self.surface.shape
-
-            # Creating coordinate grids
-            x = np.linspace(-1, 1, b)
-            y = np.linspace(-1, 1, a)
-            self.X, self.Y = np.meshgrid(x, y)
-            self.pow1 = (self.X**2 - self.Y**2)
-            self.pow2 = (self.X**2 + self.Y**2)
+            # Wedge factor of the fitted surface, coefficients are rescaled by get_coeffs
+            self.surface_wedge_factor = self.phase.get_wedge_factor()
+            # Polynomials are processed when needed (see get_basis)
+            self.basis = None
+            self.reset_factorization()
+            self.X, self.Y = None, None
+            self.pow1, self.pow2 = None, None
 
             self.corrected_phase = np.zeros_like(self.surface)
             return True
         return False
 
+    def get_basis(self) -> ZernikeBasis:
+        """
+        Return the Zernike basis on the grid of the surface, shared between measurements.
+        :return: ZernikeBasis object.
+        """
+        if self.basis is None:
+            self.basis = get_zernike_basis(self.get_valid_mask(), self.max_order)
+        return self.basis
+
     def process_cartesian_polynomials(self, noll_index: int) -> np.ndarray:
         '''Normalized (RMS) Zernike coefficients calculation.'''
-        if noll_index == 0:     # Piston
-            return np.ones_like(self.X)
-        elif noll_index == 1:   # x-Tilt
-            return 2*self.X
-        elif noll_index == 2:   # y-Tilt
-            return 2*self.Y
-        elif noll_index == 3:   # defocus
-            return np.sqrt(3)*(2*self.pow2 - 1)
-        ## ORDER 3
-        elif noll_index == 4:   # defocus / 45d primary astig
-            return 2*np.sqrt(6)*(self.X * self.Y)
-        elif noll_index == 5:   # defocus / 0d primary astig
-            return np.sqrt(6)*self.pow1
-        elif noll_index == 6:   # Primary coma
-            return np.sqrt(8)*self.Y*(3*self.pow2-2)
-        elif noll_index == 7:   # Primary coma
-            return np.sqrt(8)*self.X*(3*self.pow2-2)
-        elif noll_index == 8:   # Primary coma
-            return np.sqrt(8)*self.Y*(3*self.X**2 - self.Y**2)
-        ## ORDER 5
-        elif noll_index == 9:   # Primary coma
-            return np.sqrt(8)*self.X*(self.X**2 - 3*self.Y**2)
-        elif noll_index == 10:   # Primary Spherical Aber.
-            return np.sqrt(5)*(6*self.pow2**2 - 6*self.pow2 + 1)
-        elif noll_index == 11:   # Primary Spherical Aber.
-            return np.sqrt(10)*self.pow1*(4*self.pow2 - 3)
-        elif noll_index == 12:   # Primary Spherical Aber.
-            return 2*np.sqrt(10)*self.X*self.Y*(4*self.pow2 - 3)
-        elif noll_index == 13:   # Primary Spherical Aber.
-            return np.sqrt(10)*(self.pow2**2 - 8*self.X**2*self.Y**2)
-        elif noll_index == 14:   # Primary Spherical Aber.
-            return 4*np.sqrt(10)*self.X*self.Y*self.pow1
-        elif noll_index == 15:   # Secondary coma
-            return np.sqrt(12)*self.X*(10*(self.pow2)**2 - 12*(self.pow2) + 3)
-        ## ORDER 7
-        elif noll_index == 16:   # Secondary coma
-            return np.sqrt(12)*self.Y*(10*(self.pow2)**2 - 12*(self.pow2) + 3)
-        elif noll_index == 17:   # Secondary coma
-            return np.sqrt(12)*self.X*(self.X**2 - 3*self.Y**2)*(5*self.pow2 - 4)
-        elif noll_index == 18:   # Secondary coma
-            return np.sqrt(12)*self.Y*(3 * self.X**2 - self.Y**2)*(5*self.pow2 - 4)
-        elif noll_index == 19:   # Secondary coma
-            return np.sqrt(12)*self.X*(16*self.X**4 - 20*self.X**2*self.pow2 + 5*self.pow2**2)
-        elif noll_index == 20:   # Secondary coma
-            return np.sqrt(12)*self.Y*(16*self.Y**4 - 20*self.Y**2*self.pow2 + 5*self.pow2**2)
-        elif noll_index == 21:   # Secondary Spherical Aber.
-            return np.sqrt(7)*(20*self.pow2**3 - 30*self.pow2**2 + 12*self.pow2 - 1)
-        elif noll_index == 22:   # Secondary Spherical Aber.
-            return 2*np.sqrt(14)*self.X*self.Y*(15*self.pow2**2 - 20*self.pow2 + 6)
-        elif noll_index == 23:   # Secondary Spherical Aber.
-            return np.sqrt(14)*self.pow1*(15*self.pow2**2 - 20*self.pow2 + 6)
-        elif noll_index == 24:   # Secondary Spherical Aber.
-            return 4*np.sqrt(14)*self.X*self.Y*self.pow1*(6*self.pow2 - 5)
-        ## ORDER 9
-        elif noll_index == 25:   # Secondary Spherical Aber.
-            return np.sqrt(14)*(self.pow2**2 - 8*self.X**2*self.Y*2)*(6*self.pow2 - 5)
-        elif noll_index == 26:   # Secondary Spherical Aber.
-            return np.sqrt(14)*self.X*self.Y*(32*self.X**4 - 32*self.X**2*self.pow2 + 6*self.pow2**2)
-        elif noll_index == 27:   # Secondary Spherical Aber.
-            return np.sqrt(14)*(32*self.X**6 - 48*self.X**4*self.pow2 + 18*self.X**2*self.pow2**2 - self.pow2**3)
-
-        elif noll_index == 28:   # Secondary Spherical Aber.
-            return 4*self.Y*(35*self.pow2**3-60*self.pow2**2+30*self.pow2-4)
-        elif noll_index == 29:   # Secondary Spherical Aber.
-            return 4*self.X*(35*self.pow2**3-60*self.pow2**2+30*self.pow2-4)
-        elif noll_index == 30:   # Tertiary y-Coma
-            return 4*self.Y*(3*self.X**2-self.Y**2)*(21*self.pow2**2-30*self.pow2+10)
-        elif noll_index == 31:   # Tertiary x-Coma
-            return 4*self.X*(self.X**2-3*self.Y**2)*(21*self.pow2**2-30*self.pow2+10)
-        elif noll_index == 32:   # Secondary Spherical Aber.
-            return 4*(4*self.X**2*self.Y*self.pow1+self.Y*self.pow2**2-8*self.X**2*self.Y**3)*(7*self.pow2-6)
-        elif noll_index == 33:   # Secondary Spherical Aber.
-            return 4*(self.X*self.pow2**2-8*self.X**3*self.Y**2-4*self.X*self.Y**2*self.pow1)*(7*self.pow2-6)
-        elif noll_index == 34:   # Secondary Spherical Aber.
-            return 8*self.X**2*self.Y*(3*self.pow2**2-16*self.X**2*self.Y**2)+4*self.Y*self.pow1*(self.pow2**2-16*self.X**2*self.Y**2)
-        elif noll_index == 35:   # Secondary Spherical Aber.
-            return 4*self.X*self.pow1*(self.pow2**2-16*self.X**2*self.Y**2)-8*self.X*self.Y**2*(3*self.pow2**2-16*self.X**2*self.Y**2)
-
-        ## ORDER 11
-        elif noll_index == 36: # Tertiary spherical
-            return 3*(70*self.pow2**4-140*self.pow2**3 +90*self.pow2**2-20*self.pow2+1)
+        if self.X is None:
+            self.X, self.Y = grid_coordinates(np.shape(self.surface))
+            self.pow1 = (self.X**2 - self.Y**2)
+            self.pow2 = (self.X**2 + self.Y**2)
+        return cartesian_polynomial(noll_index, self.X, self.Y, self.pow1, self.pow2)
 
     @staticmethod
     def get_coefficients_polar(iogs_index: int, u, alpha) -> np.ndarray:
@@ -343,11 +682,10 @@ class Zernike:
     def process_zernike_coefficient(self, order: int) -> np.ndarray:
         if order <= self.max_order:
             if self.coeff_list[order] is None:
-                Z_nm = self.process_cartesian_polynomials(order)
-                # Mask NaN values
-                valid_mask = ~np.isnan(self.surface)
-                surface_filtered = self.surface[valid_mask]
-                Z_nm_filtered = Z_nm[valid_mask]
+                # Polynomial on the valid pixels only
+                basis = self.get_basis()
+                surface_filtered = np.ma.getdata(self.surface)[basis.mask]
+                Z_nm_filtered = basis.matrix[:, order]
 
                 num = np.sum(surface_filtered * Z_nm_filtered)
                 den = np.sum(Z_nm_filtered ** 2)
@@ -355,35 +693,269 @@ class Zernike:
         else:
             return None
 
-    def process_surface_correction(self, aberrations: list[str]):
-        self.corrected_phase = np.zeros_like(self.surface)
-        for k, type_ab in enumerate(aberrations):
-            coeffs = aberrations_type[type_ab]
-            for c in coeffs:
-                if self.coeff_list[c] is None:
-                    self.process_zernike_coefficient(c)
-                self.corrected_phase += self.coeff_list[c] * self.process_cartesian_polynomials(c)
+    def get_valid_mask(self) -> np.ndarray:
+        """
+        Return the mask of the valid pixels of the surface (not NaN and not masked).
+        :return: 2D boolean array.
+        """
+        surface = np.ma.getdata(self.surface)
+        return ~np.isnan(surface) & ~np.ma.getmaskarray(self.surface)
+
+    def process_design_matrix(self, max_order: int = None) -> np.ndarray:
+        """
+        Build the design matrix of the Zernike polynomials on the valid pixels of the surface.
+        :param max_order: Index of the last polynomial to include. Default max_order of the object.
+        :return: 2D array of shape (number of valid pixels, max_order + 1).
+        """
+        if max_order is None or max_order > self.max_order:
+            max_order = self.max_order
+        return self.get_basis().matrix[:, :max_order + 1]
+
+    def fit_all(self, max_order: int = None, orthonormal: bool = False) -> np.ndarray:
+        """
+        Process all the Zernike coefficients up to max_order in a single least-squares solve.
+
+        The masked design matrix is built once and all the coefficients are obtained
+        together. Contrary to process_zernike_coefficient, the result does not depend
+        on the order in which the coefficients are calculated, as the discretised
+        polynomials are not orthogonal on the pixel grid.
+
+        :param max_order: Index of the last coefficient to process. Default max_order of the object.
+        :param orthonormal: If True, project the surface on the basis orthonormalized over
+            the mask (see OrthonormalBasis) and convert back to the Zernike coefficients.
+            Coefficients of the orthonormal modes are stored in orthonormal_coeffs. Default False.
+        :return: 1D array of the max_order + 1 coefficients.
+        """
+        if max_order is None or max_order > self.max_order:
+            max_order = self.max_order
+        basis = self.get_basis()
+        surface = np.ma.getdata(self.surface)[basis.mask]
+        if orthonormal:
+            orthonormal_basis = get_orthonormal_basis(basis.mask, max_order, basis)
+            self.orthonormal_coeffs = orthonormal_basis.project(surface)
+            coeffs = orthonormal_basis.to_noll(self.orthonormal_coeffs)
+        else:
+            design = basis.matrix[:, :max_order + 1]
+            coeffs, _, rank, _ = np.linalg.lstsq(design, surface, rcond=RANK_TOLERANCE)
+            check_rank(rank, max_order + 1, 'fit_all')
+        self.coeff_list[:max_order + 1] = list(coeffs)
+        self.coeff_counter = max_order + 1
+        self.coeff_calculated = True
+        return coeffs
+
+    def fit_tiled(self, max_order: int = None, tile_rows: int = 256) -> np.ndarray:
+        """
+        Process all the Zernike coefficients up to max_order, walking the surface by tiles of rows.
+
+        The Gram matrix and the right-hand side of the normal equations are accumulated
+        tile by tile, with the polynomials evaluated on the valid pixels of the tile only.
+        The whole basis is never stored: peak memory is bounded by the size of a tile
+        times the number of polynomials. Coefficients are the same as fit_all.
+
+        :param max_order: Index of the last coefficient to process. Default max_order of the object.
+        :param tile_rows: Number of rows of the surface in each tile. Default 256.
+        :return: 1D array of the max_order + 1 coefficients.
+        """
+        if max_order is None or max_order > self.max_order:
+            max_order = self.max_order
+        n_modes = max_order + 1
+        valid_mask = self.get_valid_mask()
+        surface = np.ma.getdata(self.surface)
+        a, b = surface.shape
+        x = np.linspace(-1, 1, b)
+        y = np.linspace(-1, 1, a)
+        gram = np.zeros((n_modes, n_modes))
+        rhs = np.zeros(n_modes)
+        buffer = np.empty((n_modes, tile_rows * b))
+        for start in range(0, a, tile_rows):
+            tile_mask = valid_mask[start:start + tile_rows]
+            n_valid = np.count_nonzero(tile_mask)
+            if n_valid == 0:
+                continue
+            X, Y = np.meshgrid(x, y[start:start + tile_rows])
+            polynomials = cartesian_basis(max_order, X[tile_mask], Y[tile_mask],
+                                          out=buffer[:, :n_valid])
+            gram += polynomials @ polynomials.T
+            rhs += polynomials @ surface[start:start + tile_rows][tile_mask]
+        # Singular values of the Gram matrix are the square of the ones of the design matrix
+        coeffs, _, rank, _ = np.linalg.lstsq(gram, rhs, rcond=RANK_TOLERANCE**2)
+        check_rank(rank, n_modes, 'fit_tiled')
+        self.coeff_list[:n_modes] = list(coeffs)
+        self.coeff_counter = n_modes
+        self.coeff_calculated = True
+        return coeffs
+
+    def fit_multiresolution(self, max_order: int = 10, tolerance: float = 1e-3,
+                            factors: tuple = (16, 8, 4, 2, 1)):
+        """
+        Process the Zernike coefficients up to max_order on decimated copies of the surface.
+
+        The surface is first fitted on its most decimated copy (see lensepy.utils.downsample_array).
+        The resolution is increased until the coefficients change less than tolerance
+        between two levels. Blocks including an invalid pixel are discarded and the
+        polynomials are evaluated at the center of the blocks. Levels on which the
+        polynomials are not independent (for example fewer valid blocks than coefficients)
+        are skipped ; if all the levels are skipped, the surface is fitted at full
+        resolution (see fit_all).
+
+        :param max_order: Index of the last coefficient to process. Default 10.
+        :param tolerance: Maximum change of the coefficients between two levels. Default 1e-3.
+        :param factors: Decimation factors, from the coarsest to the finest. Default (16, 8, 4, 2, 1).
+        :return: 1D array of the max_order + 1 coefficients and decimation factor of the result.
+        """
+        if max_order > self.max_order:
+            max_order = self.max_order
+        surface = np.ma.getdata(self.surface).astype(float)
+        surface[~self.get_valid_mask()] = np.nan
+        a, b = surface.shape
+        x, y = np.linspace(-1, 1, b), np.linspace(-1, 1, a)
+        coeffs = None
+        factor = 1
+        for factor in factors:
+            surface_d = downsample_array(surface, factor)
+            # Coordinates of the center of the blocks
+            x_d = x[:(b // factor) * factor].reshape(-1, factor).mean(axis=1)
+            y_d = y[:(a // factor) * factor].reshape(-1, factor).mean(axis=1)
+            X_d, Y_d = np.meshgrid(x_d, y_d)
+            valid = ~np.isnan(surface_d)
+            if np.count_nonzero(valid) <= max_order:
+                continue
+            design = cartesian_basis(max_order, X_d[valid], Y_d[valid])
+            new_coeffs, _, rank, _ = np.linalg.lstsq(design.T, surface_d[valid], rcond=RANK_TOLERANCE)
+            if rank <= max_order:
+                continue
+            converged = coeffs is not None and np.max(np.abs(new_coeffs - coeffs)) < tolerance
+            coeffs = new_coeffs
+            if converged:
+                break
+        if coeffs is None:
+            if np.count_nonzero(self.get_valid_mask()) <= max_order:
+                raise ValueError('fit_multiresolution: not enough valid pixels for the '
+                                 f'{max_order + 1} coefficients.')
+            return self.fit_all(max_order), 1
+        self.coeff_list[:max_order + 1] = list(coeffs)
+        self.coeff_counter = max_order + 1
+        self.coeff_calculated = True
+        return coeffs, factor
+
+    def extend_order(self, max_order: int) -> np.ndarray:
+        """
+        Process all the Zernike coefficients up to max_order, reusing the QR factorization
+        of the masked basis from the previous calls.
+
+        Only the new polynomials are orthogonalized against the stored factor (classical
+        Gram-Schmidt with reorthogonalization), so increasing the order step by step costs
+        roughly the number of new polynomials. A ValueError is raised if a polynomial is
+        linearly dependent on the previous ones on the mask. A lower order reuses the
+        beginning of the factorization. Coefficients are the same as fit_all.
+
+        :param max_order: Index of the last coefficient to process.
+        :return: 1D array of the max_order + 1 coefficients.
+        """
+        if max_order > self.max_order:
+            max_order = self.max_order
+        basis = self.get_basis()
+        if self.qr_q is None:
+            # Q is grown by chunks of columns, as modes are appended
+            self.qr_q = np.empty((basis.matrix.shape[0], 0))
+            self.qr_r = np.zeros((self.max_order + 1, self.max_order + 1))
+            self.qr_projection = np.empty(self.max_order + 1)
+            self.qr_surface = np.ma.getdata(self.surface)[basis.mask]
+        for j in range(self.qr_order + 1, max_order + 1):
+            if j == self.qr_q.shape[1]:
+                columns = min(QR_CHUNK_SIZE, self.max_order + 1 - j)
+                grown = np.empty((self.qr_q.shape[0], j + columns))
+                grown[:, :j] = self.qr_q
+                self.qr_q = grown
+            q = self.qr_q[:, :j]
+            column = basis.matrix[:, j]
+            r_column = q.T @ column
+            w = column - q @ r_column
+            correction = q.T @ w
+            w -= q @ correction
+            r_column += correction
+            norm = np.linalg.norm(w)
+            if norm <= ORTHONORMAL_TOLERANCE * np.linalg.norm(column):
+                raise ValueError(f'extend_order: Zernike polynomial {j} is linearly dependent '
+                                 'on the previous ones on the mask.')
+            self.qr_q[:, j] = w / norm
+            self.qr_r[:j, j] = r_column
+            self.qr_r[j, j] = norm
+            self.qr_projection[j] = self.qr_q[:, j] @ self.qr_surface
+            self.qr_order = j
+
+        size = max_order + 1
+        coeffs = solve_triangular(self.qr_r[:size, :size], self.qr_projection[:size])
+        self.coeff_list[:max_order + 1] = list(coeffs)
+        self.coeff_counter = max_order + 1
+        self.coeff_calculated = True
+        return coeffs
+
+    def reset_factorization(self):
+        """Reset the QR factorization used by extend_order."""
+        self.qr_q = None
+        self.qr_r = None
+        self.qr_projection = None
+        self.qr_surface = None
+        self.qr_order = -1
+
+    def reconstruct_surface(self, coeffs, out: np.ndarray = None) -> np.ndarray:
+        """
+        Reconstruct a surface from Zernike coefficients, by a single product with the cached
+        polynomials on the whole grid (see get_zernike_stack).
+        :param coeffs: Coefficients of the polynomials, starting at index 0. None values are 0.
+        :param out: Preallocated C-contiguous float64 array, same shape as the surface,
+            to write the result in. Default None.
+        :return: 2D array of the reconstructed surface, on the whole grid.
+        """
+        basis = self.get_basis()
+        coeffs = np.array([0 if c is None else c for c in coeffs], dtype=basis.dtype)
+        coeffs = coeffs[:basis.get_number_of_modes()]
+        # Polynomials after the last non-zero coefficient are not used
+        nonzero = np.flatnonzero(coeffs)
+        size = nonzero[-1] + 1 if nonzero.size > 0 else 0
+        stack = get_zernike_stack(basis.mask.shape, basis.max_order, basis.dtype)
+        stack = stack[:size].reshape(size, basis.mask.size)
+        if out is None:
+            return (coeffs[:size] @ stack).reshape(basis.mask.shape)
+        if out.shape != basis.mask.shape or not out.flags.c_contiguous:
+            raise ValueError('reconstruct_surface: out must be a C-contiguous array of the surface shape.')
+        np.matmul(coeffs[:size], stack, out=out.reshape(-1))
+        return out
+
+    def _correct_surface(self, coeffs, out: np.ndarray = None):
+        """
+        Process the correction of the surface from Zernike coefficients.
+        :param coeffs: Coefficients of the polynomials to correct, starting at index 0.
+        :param out: Preallocated array to write the correction in. Default None.
+        :return: Correction and corrected surface.
+        """
+        corrected = self.reconstruct_surface(coeffs, out)
+        if np.ma.isMaskedArray(self.surface):
+            corrected = np.ma.masked_array(corrected, mask=np.ma.getmaskarray(self.surface))
+        self.corrected_phase = corrected
         # Correction de la surface
         new_surface = self.surface - self.corrected_phase
         return self.corrected_phase, new_surface
 
-    def process_surface_correction_by_coeff(self, coeffs: list[float]):
-        self.corrected_phase = np.zeros_like(self.surface)
+    def process_surface_correction(self, aberrations: list[str], out: np.ndarray = None):
+        coeffs = np.zeros(self.max_order + 1)
+        for k, type_ab in enumerate(aberrations):
+            for c in aberrations_type[type_ab]:
+                if self.coeff_list[c] is None:
+                    self.process_zernike_coefficient(c)
+                coeffs[c] += self.coeff_list[c]
+        return self._correct_surface(coeffs, out)
+
+    def process_surface_correction_by_coeff(self, coeffs: list[float], out: np.ndarray = None):
+        corrected_coeffs = np.zeros(self.max_order + 1)
         for c in coeffs:
             self.process_zernike_coefficient(int(c))
-            self.corrected_phase += self.coeff_list[int(c)] * self.process_cartesian_polynomials(int(c))
-        # Correction de la surface
-        new_surface = self.surface - self.corrected_phase
-        return self.corrected_phase, new_surface
+            corrected_coeffs[int(c)] += self.coeff_list[int(c)]
+        return self._correct_surface(corrected_coeffs, out)
 
-    def phase_correction(self, corrected_coeffs: list[float]):
-        self.corrected_phase = np.zeros_like(self.surface)
-        for i, c in enumerate(corrected_coeffs):
-            self.corrected_phase += c * self.process_cartesian_polynomials(i)
-        # Correction de la surface
-        new_surface = self.surface - self.corrected_phase
-
-        return self.corrected_phase, new_surface
+    def phase_correction(self, corrected_coeffs: list[float], out: np.ndarray = None):
+        return self._correct_surface(corrected_coeffs, out)
 
     def get_coeff_counter(self) -> int:
         """
@@ -394,10 +966,12 @@ class Zernike:
 
     def get_coeffs(self, nm_bool=False):
         """
-        Return an array of the coefficients.
+        Return an array of the coefficients of the surface, for the current wedge factor
+        (same convention as ZygoPipeline.get_coefficients, see surface_coefficients).
         :return: 1D array with the coefficients.
         """
-        coeffs = -np.array(self.coeff_list.copy()) * self.phase.get_wedge_factor()
+        coeffs = surface_coefficients(self.coeff_list, self.phase.get_wedge_factor(),
+                                      self.surface_wedge_factor)
         if nm_bool:
             coeffs = coeffs * self.lambda_value * 1e-3 # nm -> um
         return coeffs
@@ -408,7 +982,10 @@ class Zernike:
         self.coeff_counter = 0
         self.coeff_calculated = False
         self.coeff_list = [None] * (self.max_order + 1)
+        self.orthonormal_coeffs = None
         self.polynomials = [None] * (self.max_order + 1)
+        self.reset_factorization()
+        self.basis = None
         self.X = None
         self.Y = None
         self.pow1 = None
@@ -439,50 +1016,57 @@ class Zernike:
         Sph. Ab.    | 6*C11         |    no
         """
         c = self.coeff_list
-        state = True
-        for k in range(11):
-            if c[k] is None:
-                state = False
-
-        if state:
-            # Tilt
-            tilt_magnitude = np.sqrt(c[3]**2 + c[2]**2)
-            tilt_angle = np.rad2deg(np.arctan2(c[3], c[2]))
-
-            # Defocus
-            defocus_amplitude = 2*c[4]
-
-            # Astigmatism
-            astigmatism_magnitude = 2 * np.sqrt(c[6]**2+c[5]**2)
-            astigmatism_angle = np.rad2deg(1/2* np.arctan2(c[6], c[5]))
-
-            # Coma
-            coma_amplitude = 3 * np.sqrt(c[7]**2+c[8]**2)
-            coma_angle = np.rad2deg(np.arctan2(c[8], c[7]))
-
-            # Spherical aberration
-            sp_ab_magnitude = 6*c[11]
-
-            # Round
-            tilt_magnitude = np.round(tilt_magnitude, COEFFICIENTS_ROUND_RANGE)
-            tilt_angle = np.round(tilt_angle, COEFFICIENTS_ROUND_RANGE)
-            defocus_amplitude = np.round(defocus_amplitude, COEFFICIENTS_ROUND_RANGE)
-            astigmatism_magnitude = np.round(astigmatism_magnitude, COEFFICIENTS_ROUND_RANGE)
-            astigmatism_angle = np.round(astigmatism_angle, COEFFICIENTS_ROUND_RANGE)
-            coma_amplitude = np.round(coma_amplitude, COEFFICIENTS_ROUND_RANGE)
-            coma_angle = np.round(coma_angle, COEFFICIENTS_ROUND_RANGE)
-            sp_ab_magnitude = np.round(sp_ab_magnitude, COEFFICIENTS_ROUND_RANGE)
-
-            # Return dict
-            result = {'tilt_mag': tilt_magnitude, 'tilt_ang': tilt_angle,
-                      'defocus_mag': defocus_amplitude, 'sphere_mag': sp_ab_magnitude,
-                      'astig_mag': astigmatism_magnitude, 'astig_ang': astigmatism_angle,
-                      'coma_mag': coma_amplitude_, 'coma_ang': coma_angle}
-            return result
-        else:
+        if any(c[k] is None for k in range(12)):
             return {}
+        magnitudes, angles = convert_to_seidel_batch(np.array(c[:12], dtype=float),
+                                                     COEFFICIENTS_ROUND_RANGE)
+        # Return dict
+        result = {'tilt_mag': magnitudes['tilt'][0], 'tilt_ang': angles['tilt'][0],
+                  'defocus_mag': magnitudes['defocus'][0], 'sphere_mag': magnitudes['sphere'][0],
+                  'astig_mag': magnitudes['astig'][0], 'astig_ang': angles['astig'][0],
+                  'coma_mag': magnitudes['coma'][0], 'coma_ang': angles['coma'][0]}
+        return result
 
 
+seidel_magnitudes_dtype = np.dtype([('tilt', float), ('defocus', float), ('astig', float),
+                                    ('coma', float), ('sphere', float)])
+seidel_angles_dtype = np.dtype([('tilt', float), ('astig', float), ('coma', float)])
+
+
+def convert_to_seidel_batch(coeffs: np.ndarray, decimals: int = None):
+    """
+    Process Seidel coefficients from Zernike coefficients, for N sets of coefficients at once.
+    Same convention as Zernike.convert_to_seidel.
+    :param coeffs: Array of shape (N, >=12) or (>=12,) of Zernike coefficients, starting at index 0.
+    :param decimals: Number of decimals to round the results. Default None, no rounding.
+    :return: Structured arrays of N magnitudes (tilt, defocus, astig, coma, sphere)
+        and N angles in degrees (tilt, astig, coma).
+    """
+    c = np.atleast_2d(np.asarray(coeffs, dtype=float))
+    if c.shape[1] < 12:
+        raise ValueError('convert_to_seidel_batch: at least 12 coefficients are required.')
+    magnitudes = np.empty(c.shape[0], dtype=seidel_magnitudes_dtype)
+    angles = np.empty(c.shape[0], dtype=seidel_angles_dtype)
+    # Tilt
+    magnitudes['tilt'] = np.hypot(c[:, 3], c[:, 2])
+    angles['tilt'] = np.rad2deg(np.arctan2(c[:, 3], c[:, 2]))
+    # Defocus
+    magnitudes['defocus'] = 2 * c[:, 4]
+    # Astigmatism
+    magnitudes['astig'] = 2 * np.hypot(c[:, 6], c[:, 5])
+    angles['astig'] = np.rad2deg(np.arctan2(c[:, 6], c[:, 5]) / 2)
+    # Coma
+    magnitudes['coma'] = 3 * np.hypot(c[:, 7], c[:, 8])
+    angles['coma'] = np.rad2deg(np.arctan2(c[:, 8], c[:, 7]))
+    # Spherical aberration
+    magnitudes['sphere'] = 6 * c[:, 11]
+    if decimals is not None:
+        for name in magnitudes.dtype.names:
+            magnitudes[name] = np.round(magnitudes[name], decimals)
+        for name in angles.dtype.names:
+            angles[name] = np.round(angles[name], decimals)
+    return magnitudes, angles
+
 
 def display_3_figures(init, zer, corr):
     """Displaying results."""
@@ -527,6 +1111,101 @@ def zernike(n, m, r, theta):
     else:
         return np.sqrt(2*(n+1)) * R * np.sin(-m*theta)
 
+def noll_to_nm_index(j: int) -> tuple[int, int]:
+    """
+    Convert a Noll index to the radial and azimuthal orders of the Zernike polynomial.
+    Even j correspond to cosine terms (m > 0) and odd j to sine terms (m < 0).
+    :param j: Noll index, starting at 1 for piston.
+    :return: Radial order n and azimuthal order m.
+    """
+    n = 0
+    while (n + 1) * (n + 2) // 2 < j:
+        n += 1
+    k = j - n * (n + 1) // 2
+    if n % 2 == 0:
+        m = 2 * (k // 2)
+    else:
+        m = 2 * ((k - 1) // 2) + 1
+    if m != 0 and j % 2 == 1:
+        m = -m
+    return n, m
+
+
+def zernike_basis(n_modes: int, r: np.ndarray, theta: np.ndarray,
+                  first_mode: int = 1) -> np.ndarray:
+    """
+    Normalized (RMS) Zernike polynomials in the Noll order, from polar coordinates.
+    :param n_modes: Noll index of the last polynomial.
+    :param r: Normalized radius.
+    :param theta: Angle in radians.
+    :param first_mode: Noll index of the first polynomial. Default 1 (piston).
+    :return: Array of shape (n_modes - first_mode + 1, *r.shape).
+    """
+    return _zernike_basis(n_modes, np.asarray(r), np.cos(theta), np.sin(theta), first_mode)
+
+
+def zernike_basis_cartesian(n_modes: int, X: np.ndarray, Y: np.ndarray,
+                            first_mode: int = 1, out: np.ndarray = None) -> np.ndarray:
+    """
+    Normalized (RMS) Zernike polynomials in the Noll order, from cartesian coordinates.
+    :param n_modes: Noll index of the last polynomial.
+    :param X: X-coordinates, normalized in [-1, 1].
+    :param Y: Y-coordinates, normalized in [-1, 1].
+    :param first_mode: Noll index of the first polynomial. Default 1 (piston).
+    :param out: Preallocated array of shape (n_modes - first_mode + 1, *X.shape). Default None.
+    :return: Array of shape (n_modes - first_mode + 1, *X.shape).
+    """
+    r = np.hypot(X, Y)
+    cos_t = np.divide(X, r, out=np.ones_like(r), where=r > 0)
+    sin_t = np.divide(Y, r, out=np.zeros_like(r), where=r > 0)
+    return _zernike_basis(n_modes, r, cos_t, sin_t, first_mode, out)
+
+
+def _zernike_basis(n_modes: int, r: np.ndarray, cos_t: np.ndarray, sin_t: np.ndarray,
+                   first_mode: int = 1, out: np.ndarray = None) -> np.ndarray:
+    """
+    Zernike polynomials from the radial recurrence of Prata and Rusch,
+    R(n, m) = r * (R(n-1, |m-1|) + R(n-1, m+1)) - R(n-2, m),
+    and the Chebyshev recurrence for cos(m.theta) and sin(m.theta).
+    Only two radial orders are kept in memory during the calculation.
+    """
+    # Output index and signed azimuthal order of each (n, |m|) radial polynomial
+    modes = {}
+    for j in range(first_mode, n_modes + 1):
+        n, m = noll_to_nm_index(j)
+        modes.setdefault((n, abs(m)), []).append((j - first_mode, m))
+    n_max = max(n for n, _ in modes)
+    m_max = max(m for _, m in modes)
+    basis = np.empty((n_modes - first_mode + 1,) + r.shape, dtype=r.dtype) if out is None else out
+
+    # Angular terms
+    cos_m = [np.ones_like(cos_t), cos_t]
+    sin_m = [np.zeros_like(sin_t), sin_t]
+    for m in range(2, m_max + 1):
+        cos_m.append(2 * cos_t * cos_m[-1] - cos_m[-2])
+        sin_m.append(2 * cos_t * sin_m[-1] - sin_m[-2])
+
+    # Radial terms, order by order
+    previous_2, previous = {}, {}
+    for n in range(n_max + 1):
+        current = {}
+        for m in range(n % 2, n + 1, 2):
+            if n == 0:
+                current[m] = np.ones_like(r)
+            elif m == n:
+                current[m] = r * previous[n - 1]
+            else:
+                current[m] = r * (previous[abs(m - 1)] + previous[m + 1]) - previous_2[m]
+            for index, m_signed in modes.get((n, m), []):
+                if m_signed == 0:
+                    basis[index] = np.sqrt(n + 1) * current[m]
+                elif m_signed > 0:
+                    basis[index] = np.sqrt(2 * (n + 1)) * current[m] * cos_m[m]
+                else:
+                    basis[index] = np.sqrt(2 * (n + 1)) * current[m] * sin_m[m]
+        previous_2, previous = previous, current
+    return basis
+
 def elliptic_mask(image, cx=0, cy=0, a=0.5, b=0.5):
     """Create elliptic mask on an image.
     :param image: initial image to mask
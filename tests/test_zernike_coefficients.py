@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Tests of lensepy.optics.zygo.zernike_coefficients."""
+import numpy as np
+import pytest
+from lensepy.optics.zygo.zernike_coefficients import (Zernike, cartesian_polynomial, cartesian_basis,
+                                                      zernike_basis_cartesian, fit_zernike_stack)
+
+
+class Phase:
+    """Unwrapped phase ready to be fitted, as given by PhaseModel."""
+    def __init__(self, surface):
+        self.surface = surface
+
+    def is_analysis_ready(self):
+        return True
+
+    def get_unwrapped_phase(self):
+        return self.surface
+
+    def get_wedge_factor(self):
+        return 1.0
+
+
+@pytest.fixture
+def grid():
+    x = np.linspace(-1, 1, 201)
+    X, Y = np.meshgrid(x, x)
+    return X, Y, X**2 + Y**2 <= 1
+
+
+def test_recurrence_matches_cartesian_polynomials(grid):
+    X, Y, mask = grid
+    recurrence = zernike_basis_cartesian(37, X, Y)
+    for index in range(37):
+        polynomial = cartesian_polynomial(index, X, Y, X**2 - Y**2, X**2 + Y**2)
+        np.testing.assert_allclose(polynomial[mask], recurrence[index][mask], atol=1e-9,
+                                   err_msg=f'Zernike polynomial {index}')
+
+
+def test_masked_basis_has_full_rank(grid):
+    X, Y, mask = grid
+    matrix = cartesian_basis(36, X, Y)[:, mask].T
+    assert np.linalg.matrix_rank(matrix) == 37
+
+
+def test_fit_paths_agree(grid):
+    X, Y, mask = grid
+    rng = np.random.default_rng(0)
+    expected = rng.normal(size=37)
+    surface = np.tensordot(expected, cartesian_basis(36, X, Y), axes=1)
+    surface += 1e-3 * rng.normal(size=surface.shape)
+    surface = np.ma.masked_array(surface, mask=~mask)
+    zernike = Zernike(Phase(surface))
+    coeffs = zernike.fit_all()
+    np.testing.assert_allclose(coeffs, expected, atol=1e-3)
+    np.testing.assert_allclose(zernike.fit_all(orthonormal=True), coeffs, atol=1e-10)
+    np.testing.assert_allclose(zernike.extend_order(20), zernike.fit_all(20), atol=1e-10)
+    np.testing.assert_allclose(zernike.extend_order(36), coeffs, atol=1e-10)
+    np.testing.assert_allclose(zernike.fit_tiled(tile_rows=64), coeffs, atol=1e-8)
+    np.testing.assert_allclose(fit_zernike_stack(surface[np.newaxis])[0], coeffs, atol=1e-10)
+
+
+def test_rank_deficient_mask_raises(grid):
+    X, Y, _ = grid
+    # A few pixels on a line cannot separate the 37 polynomials
+    surface = np.ma.masked_array(X, mask=np.abs(Y) > 0.005)
+    with pytest.raises(ValueError):
+        Zernike(Phase(surface)).fit_all()
+    with pytest.raises(ValueError):
+        Zernike(Phase(surface)).fit_all(orthonormal=True)
+    with pytest.raises(ValueError):
+        Zernike(Phase(surface)).extend_order(36)